@@ -0,0 +1,64 @@
+"""
+Benchmark of the approximate (IVF) full-catalog recommendation against the exact dense scoring.
+
+Run it from the root of the repository, after exporting the embeddings with
+data/ml-100k/recsys_training.py:
+
+    python -m benchmarks.ann_recommendation --k 10 --nprobe 1 2 4 8 16
+"""
+import os
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from src.recsys_backends import NumpyScorer
+from src.ann_index import IVFInnerProductIndex
+
+load_dotenv()
+
+
+def exact_top_k(scorer, user_index, k):
+    scores = scorer.scores(user_index)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(top, np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1), axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--embeddings_dir", default=os.getenv("RECSYS_EMBEDDINGS_DIR"),
+                        help="Directory with the exported embeddings")
+    parser.add_argument("--k", type=int, default=10, help="Number of recommended items")
+    parser.add_argument("--n_lists", type=int, default=None, help="Number of inverted lists of the index")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="Numbers of scanned lists to be compared")
+    parser.add_argument("--n_users", type=int, default=500, help="Number of users used as queries")
+    args = parser.parse_args()
+
+    scorer = NumpyScorer(args.embeddings_dir)
+    rng = np.random.default_rng(0)
+    n_users = len(scorer.user_embeddings) - 1
+    users = rng.choice(np.arange(1, n_users + 1), min(args.n_users, n_users), replace=False)
+
+    start = time.perf_counter()
+    index = IVFInnerProductIndex.build(scorer.item_embeddings, n_lists=args.n_lists)
+    print(f"Index with {index.n_lists} lists over {len(index.item_index)} items built in "
+          f"{time.perf_counter() - start:.3f}s")
+
+    start = time.perf_counter()
+    exact = [exact_top_k(scorer, np.array([u]), args.k)[0] for u in users]
+    exact_ms = (time.perf_counter() - start) / len(users) * 1000
+    print(f"{'method':>12} | {'recall@' + str(args.k):>10} | {'ms/user':>8}")
+    print(f"{'exact':>12} | {1.0:>10.4f} | {exact_ms:>8.4f}")
+
+    for nprobe in args.nprobe:
+        history = [scorer.history_indices[scorer.history_indptr[u]:scorer.history_indptr[u + 1]] for u in users]
+        start = time.perf_counter()
+        approximate = [index.search(scorer.user_embeddings[[u]], args.k, nprobe=nprobe, exclude=[h])[0]
+                       for u, h in zip(users, history)]
+        ann_ms = (time.perf_counter() - start) / len(users) * 1000
+        recall = np.mean([len(np.intersect1d(e, a[a >= 0])) / args.k for e, a in zip(exact, approximate)])
+        print(f"{'nprobe=' + str(nprobe):>12} | {recall:>10.4f} | {ann_ms:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
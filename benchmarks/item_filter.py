@@ -0,0 +1,86 @@
+"""
+Benchmark of the in-memory item filter index against the SQL queries previously generated for the
+item filter tool (LIKE scans for the textual features and comparisons for the numerical ones).
+
+Run it from the root of the repository, after the database has been created:
+
+    python -m benchmarks.item_filter --n_queries 1000
+"""
+import time
+import argparse
+import numpy as np
+from src.database import get_connection_pool
+from src.item_filter_index import ItemFilterIndex, NUMERIC_FEATURES, TEXTUAL_FEATURES
+from src.item_catalog import get_item_catalog
+from src.utils import read_ml100k_item_lists
+
+REQUESTS = ("higher", "lower", "exact")
+OPERATORS = {"higher": ">", "lower": "<", "exact": "="}
+
+
+def random_filter(index, rng):
+    """
+    Draws a conjunctive filter with one or two textual conditions and one or two numerical ones,
+    as the ones generated by the LLM for the item filter tool.
+    """
+    features = rng.choice(list(TEXTUAL_FEATURES), rng.integers(1, 3), replace=False)
+    conditions = [(str(f), str(rng.choice(list(index.postings[f])))) for f in features]
+    ranges = []
+    for f in rng.choice(NUMERIC_FEATURES, rng.integers(1, 3), replace=False):
+        values = index.sorted_columns[str(f)][0]
+        ranges.append((str(f), str(rng.choice(REQUESTS)), int(rng.choice(values))))
+    return conditions, ranges
+
+
+def sql_filter(conditions, ranges):
+    query_parts = [f"LOWER({f}) LIKE ?" for f, _ in conditions]
+    query_parts += [f"{f} {OPERATORS[r]} ?" for f, r, _ in ranges]
+    params = [f"%{name}%" for _, name in conditions] + [t for _, _, t in ranges]
+    return f"SELECT item_id FROM items WHERE {' AND '.join(query_parts)}", params
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_queries", type=int, default=1000, help="Number of random filters")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random filters")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = ItemFilterIndex.build(get_item_catalog(), read_ml100k_item_lists())
+    print(f"Index over {index.size} items built in {time.perf_counter() - start:.3f}s")
+
+    rng = np.random.default_rng(args.seed)
+    filters = [random_filter(index, rng) for _ in range(args.n_queries)]
+    pool = get_connection_pool()
+
+    start = time.perf_counter()
+    sql_results = [pool.execute(*sql_filter(conditions, ranges)) for conditions, ranges in filters]
+    sql_us = (time.perf_counter() - start) / len(filters) * 1e6
+
+    start = time.perf_counter()
+    index_results = [index.match(conditions, ranges) for conditions, ranges in filters]
+    index_us = (time.perf_counter() - start) / len(filters) * 1e6
+
+    start = time.perf_counter()
+    for conditions, ranges in filters:
+        index.match_bitset(conditions, ranges)
+    bitset_us = (time.perf_counter() - start) / len(filters) * 1e6
+
+    # numerical comparisons must give the same items, textual matches differ only for substring hits and
+    # for the non-ASCII names that LOWER does not fold
+    numeric_agreement = np.mean([
+        np.array_equal(index.match(ranges=ranges), sorted(r[0] for r in pool.execute(*sql_filter([], ranges))))
+        for _, ranges in filters
+    ])
+    contained = np.mean([set(i.tolist()) <= {r[0] for r in s} for i, s in zip(index_results, sql_results)])
+
+    print(f"{'method':>14} | {'us/query':>10}")
+    print(f"{'sql':>14} | {sql_us:>10.1f}")
+    print(f"{'index (ids)':>14} | {index_us:>10.1f}")
+    print(f"{'index (bitset)':>14} | {bitset_us:>10.1f}")
+    print(f"Numerical filters with the same result as SQL: {numeric_agreement:.2%}")
+    print(f"Filters whose result is contained in the SQL one: {contained:.2%}")
+
+
+if __name__ == "__main__":
+    main()
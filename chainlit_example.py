@@ -2,40 +2,50 @@ from typing import Annotated
 from langchain_core.messages.utils import count_tokens_approximately, trim_messages
 from typing_extensions import TypedDict
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph.message import add_messages
 import os
+import asyncio
 import argparse
 from langchain.chat_models import init_chat_model
 from dotenv import load_dotenv
-import json
-from langchain_core.messages import ToolMessage, AIMessageChunk
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import RunnableLambda
 from langchain_ollama.chat_models import ChatOllama
-from src.tools.get_top_k_recommendations import get_top_k_recommendations_tool
+from src.tools.get_top_k_recommendations import get_top_k_recommendations_tool, get_top_k_recommendations_batch_tool
 from src.utils import create_ml100k_db, create_vector_store, ensure_qdrant_running
 from src.tools.item_filter import item_filter_tool
 from src.tools.get_user_metadata import get_user_metadata_tool
 from src.tools.get_item_metadata import get_item_metadata_tool
 from src.tools.get_interacted_items import get_interacted_items_tool
 from src.tools.get_like_percentage import get_like_percentage_tool
+from src.tools.get_similar_items import get_similar_items_tool
 from src.tools.get_popular_items import get_popular_items_tool
-from src.tools.vector_store_search import vector_store_search_tool
+from src.tools.vector_store_search import vector_store_search_tool, vector_store_search_batch_tool
 from src.tools.utils import create_lists_for_fuzzy_matching
+from src.vector_store import start_vector_store_service, stop_vector_store_service
+from src.tool_node import AsyncToolNode
+from src.session_store import SessionStore
 from src.constants import SYSTEM_MESSAGE, SYSTEM_MESSAGE_ENHANCED
 import chainlit as cl
+import atexit
 load_dotenv()
 
-memory = MemorySaver()
+# conversation threads are saved on disk, one per chat session, and deleted when idle
+session_store = SessionStore()
 
 # create database
 create_ml100k_db()
 create_lists_for_fuzzy_matching()
 ensure_qdrant_running()
 create_vector_store()
+# load the embedding model and open the vector backend once, before the first query
+start_vector_store_service()
+atexit.register(stop_vector_store_service)
 
 # this is the list of tools that can be used by the LLM
 tools = [item_filter_tool, get_user_metadata_tool, get_item_metadata_tool, get_interacted_items_tool,
-         get_top_k_recommendations_tool, get_like_percentage_tool, get_popular_items_tool, vector_store_search_tool]
+         get_top_k_recommendations_tool, get_top_k_recommendations_batch_tool, get_like_percentage_tool,
+         get_popular_items_tool, vector_store_search_tool, vector_store_search_batch_tool, get_similar_items_tool]
 
 # this defines the state of the LLM, containing all the messages of the session
 class State(TypedDict):
@@ -78,42 +88,16 @@ def chatbot(state: State):
     response = llm_with_tools.invoke(messages)
     return {"messages": [response]}
 
-# this is the tool node
-class BasicToolNode:
-    """A node that runs the tools requested in the last AIMessage."""
-
-    def __init__(self, tools: list) -> None:
-        self.tools_by_name = {tool.name: tool for tool in tools}
-
-    def __call__(self, inputs: dict):
-        if messages := inputs.get("messages", []):
-            message = messages[-1]
-        else:
-            raise ValueError("No message found in input")
-        outputs = []
-        for tool_call in message.tool_calls:
-            tool_result = self.tools_by_name[tool_call["name"]].invoke(
-                tool_call["args"]
-            )
-            outputs.append(
-                ToolMessage(
-                    content=json.dumps(tool_result),
-                    name=tool_call["name"],
-                    tool_call_id=tool_call["id"],
-                )
-            )
-        return {"messages": outputs}
-
-
 # The first argument is the unique node name
 # The second argument is the function or object that will be called whenever
 # the node is used.
 graph_builder.add_node("chatbot", chatbot)
 
-# define the tool node
-tool_node = BasicToolNode(tools=tools)
-# add the node to the graph
-graph_builder.add_node("tools", tool_node)
+# define the tool node: independent tool calls run concurrently, each one bounded by a timeout
+tool_node = AsyncToolNode(tools=tools)
+# add the node to the graph, with both the blocking and the async entry points
+graph_builder.add_node("tools", RunnableLambda(tool_node.invoke, afunc=tool_node.ainvoke))
+atexit.register(tool_node.shutdown)
 
 def route_tools(
     state: State,
@@ -147,27 +131,45 @@ graph_builder.add_conditional_edges(
 # Any time a tool is called, we return to the chatbot to decide the next step
 graph_builder.add_edge("tools", "chatbot")
 graph_builder.add_edge(START, "chatbot")
-graph = graph_builder.compile(checkpointer=memory)
+graph = None
+graph_lock = asyncio.Lock()
 
-# this is like the stream_tokes in Entities API
-# given the user input, it produces the output of the LLM
-config = {"configurable": {"thread_id": "1"}}
+
+async def get_graph():
+    """
+    Compiles the graph the first time it is needed, as the SQLite checkpointer must be opened inside
+    the event loop of Chainlit.
+    """
+    global graph
+    async with graph_lock:
+        if graph is None:
+            graph = graph_builder.compile(checkpointer=await session_store.setup())
+    return graph
 
 @cl.on_chat_start
-def start():
-    # Initialize the session state
-    cl.user_session.set("conversation_started", False)
-    cl.user_session.set("messages", [])
+async def start():
+    # every chat gets its own conversation thread, named after the Chainlit thread so that it can be resumed
+    cl.user_session.set("thread_id", cl.context.session.thread_id)
+    await get_graph()
+
+@cl.on_chat_resume
+async def resume(thread):
+    # the checkpoints of a resumed chat are still there, unless the thread has been idle for more than SESSION_TTL
+    cl.user_session.set("thread_id", thread["id"])
+    await get_graph()
 
 @cl.on_message
 async def stream_graph_updates(message: cl.Message):
     user_input = message.content
-    conversation_started = cl.user_session.get("conversation_started")
-    messages = cl.user_session.get("messages")
-
-    if not conversation_started:
+    thread_id = cl.user_session.get("thread_id")
+    config = {"configurable": {"thread_id": thread_id}}
+    graph = await get_graph()
+    await session_store.touch(thread_id)
+
+    # the checkpointer already stores the history of the thread, so only the new messages are sent
+    messages = []
+    if not (await graph.aget_state(config)).values.get("messages"):
         messages.extend(SYSTEM_MESSAGE if os.getenv("SELF_HOST") == "true" else SYSTEM_MESSAGE_ENHANCED)
-        cl.user_session.set("conversation_started", True)
 
     messages.append({"role": "user", "content": user_input})
 
@@ -183,5 +185,3 @@ async def stream_graph_updates(message: cl.Message):
         #         await cl.Message(content=content).send()
 
     await msg.send()
-    # Save updated message list
-    cl.user_session.set("messages", messages)
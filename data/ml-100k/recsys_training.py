@@ -1,5 +1,8 @@
-from recbole.quick_start import run_recbole
+from recbole.quick_start import run_recbole, load_data_and_model
 from pathlib import Path
+import hashlib
+import json
+import numpy as np
 
 def set_env_variable(key, value, env_file_path="../../.env"):
     env_path = Path(env_file_path)
@@ -23,6 +26,38 @@ def set_env_variable(key, value, env_file_path="../../.env"):
     with env_path.open("w") as file:
         file.writelines(lines)
 
+def export_embeddings(model_path, embeddings_dir):
+    """
+    Exports what the NumPy recommendation backend needs to score users without RecBole and torch: the
+    user and item embeddings of the BPR model, their tokens (the original user and item IDs, indexed by
+    the internal IDs of RecBole), the train and validation history of every user as a CSR structure,
+    and the SHA-256 hash of the model file.
+    """
+    config, model, dataset, train_data, valid_data, test_data = load_data_and_model(model_file=str(model_path))
+    embeddings_dir.mkdir(parents=True, exist_ok=True)
+
+    np.save(embeddings_dir / "user_embeddings.npy", model.user_embedding.weight.detach().cpu().numpy())
+    np.save(embeddings_dir / "item_embeddings.npy", model.item_embedding.weight.detach().cpu().numpy())
+    np.save(embeddings_dir / "user_tokens.npy", np.asarray(dataset.field2id_token[dataset.uid_field]).astype(str))
+    np.save(embeddings_dir / "item_tokens.npy", np.asarray(dataset.field2id_token[dataset.iid_field]).astype(str))
+
+    # items seen in training and validation, which are excluded from the recommendations as full_sort_scores does
+    users = np.concatenate([data.dataset.inter_feat[dataset.uid_field].numpy() for data in (train_data, valid_data)])
+    items = np.concatenate([data.dataset.inter_feat[dataset.iid_field].numpy() for data in (train_data, valid_data)])
+    pairs = np.unique(np.stack([users, items], axis=1), axis=0)
+    history_indptr = np.zeros(dataset.user_num + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pairs[:, 0], minlength=dataset.user_num), out=history_indptr[1:])
+    np.save(embeddings_dir / "history_indptr.npy", history_indptr)
+    np.save(embeddings_dir / "history_indices.npy", pairs[:, 1].astype(np.int64))
+
+    sha = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    with open(embeddings_dir / "meta.json", "w") as f:
+        json.dump({"model_sha256": sha.hexdigest(), "model_path": str(model_path)}, f)
+    print(f"Exported the embeddings of {dataset.user_num - 1} users and {dataset.item_num - 1} items to {embeddings_dir}")
+
 run_recbole(model='BPR', dataset='ml-100k', config_file_list=['./bprmf-100k.yaml'])
 
 saved_dir = Path("./saved")
@@ -32,5 +67,10 @@ if saved_file and saved_file.is_file():
     full_path = saved_file.resolve()
     set_env_variable("RECSYS_MODEL_PATH", str(full_path))
     print(f"Added to .env: RECSYS_MODEL_PATH={full_path}")
+
+    embeddings_dir = Path("./embeddings").resolve()
+    export_embeddings(full_path, embeddings_dir)
+    set_env_variable("RECSYS_EMBEDDINGS_DIR", str(embeddings_dir))
+    print(f"Added to .env: RECSYS_EMBEDDINGS_DIR={embeddings_dir}")
 else:
     print("No file found in ./saved/")
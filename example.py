@@ -8,19 +8,22 @@ import os
 import argparse
 from langchain.chat_models import init_chat_model
 from dotenv import load_dotenv
-import json
-from langchain_core.messages import ToolMessage, AIMessageChunk
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import RunnableLambda
 from langchain_ollama.chat_models import ChatOllama
-from src.tools.get_top_k_recommendations import get_top_k_recommendations_tool
+from src.tools.get_top_k_recommendations import get_top_k_recommendations_tool, get_top_k_recommendations_batch_tool
 from src.utils import create_ml100k_db, create_vector_store, ensure_qdrant_running
 from src.tools.item_filter import item_filter_tool
 from src.tools.get_user_metadata import get_user_metadata_tool
 from src.tools.get_item_metadata import get_item_metadata_tool
 from src.tools.get_interacted_items import get_interacted_items_tool
 from src.tools.get_like_percentage import get_like_percentage_tool
+from src.tools.get_similar_items import get_similar_items_tool
 from src.tools.get_popular_items import get_popular_items_tool
-from src.tools.vector_store_search import vector_store_search_tool
+from src.tools.vector_store_search import vector_store_search_tool, vector_store_search_batch_tool
 from src.tools.utils import create_lists_for_fuzzy_matching
+from src.vector_store import start_vector_store_service, stop_vector_store_service
+from src.tool_node import AsyncToolNode
 from src.constants import SYSTEM_MESSAGE, SYSTEM_MESSAGE_ENHANCED
 load_dotenv()
 
@@ -39,10 +42,13 @@ create_ml100k_db()
 create_lists_for_fuzzy_matching()
 ensure_qdrant_running()
 create_vector_store()
+# load the embedding model and open the vector backend once, before the first query
+start_vector_store_service()
 
 # this is the list of tools that can be used by the LLM
 tools = [item_filter_tool, get_user_metadata_tool, get_item_metadata_tool, get_interacted_items_tool,
-         get_top_k_recommendations_tool, get_like_percentage_tool, get_popular_items_tool, vector_store_search_tool]
+         get_top_k_recommendations_tool, get_top_k_recommendations_batch_tool, get_like_percentage_tool,
+         get_popular_items_tool, vector_store_search_tool, vector_store_search_batch_tool, get_similar_items_tool]
 
 # this defines the state of the LLM, containing all the messages of the session
 class State(TypedDict):
@@ -85,42 +91,15 @@ def chatbot(state: State):
     response = llm_with_tools.invoke(messages)
     return {"messages": [response]}
 
-# this is the tool node
-class BasicToolNode:
-    """A node that runs the tools requested in the last AIMessage."""
-
-    def __init__(self, tools: list) -> None:
-        self.tools_by_name = {tool.name: tool for tool in tools}
-
-    def __call__(self, inputs: dict):
-        if messages := inputs.get("messages", []):
-            message = messages[-1]
-        else:
-            raise ValueError("No message found in input")
-        outputs = []
-        for tool_call in message.tool_calls:
-            tool_result = self.tools_by_name[tool_call["name"]].invoke(
-                tool_call["args"]
-            )
-            outputs.append(
-                ToolMessage(
-                    content=json.dumps(tool_result),
-                    name=tool_call["name"],
-                    tool_call_id=tool_call["id"],
-                )
-            )
-        return {"messages": outputs}
-
-
 # The first argument is the unique node name
 # The second argument is the function or object that will be called whenever
 # the node is used.
 graph_builder.add_node("chatbot", chatbot)
 
-# define the tool node
-tool_node = BasicToolNode(tools=tools)
-# add the node to the graph
-graph_builder.add_node("tools", tool_node)
+# define the tool node: independent tool calls run concurrently, each one bounded by a timeout
+tool_node = AsyncToolNode(tools=tools)
+# add the node to the graph, with both the blocking and the async entry points
+graph_builder.add_node("tools", RunnableLambda(tool_node.invoke, afunc=tool_node.ainvoke))
 
 def route_tools(
     state: State,
@@ -186,6 +165,9 @@ while True:
         break
     stream_graph_updates(user_input)
 
+tool_node.shutdown()
+stop_vector_store_service()
+
 
 # todo add database for sessions
 # todo fix item_filter so that a list of items is returned instead of returning the path to a file??
\ No newline at end of file
@@ -0,0 +1,130 @@
+import os
+import json
+from typing import Optional
+import numpy as np
+
+# number of inverted lists scanned for each query: the higher, the better the recall and the slower the search
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", 8))
+
+
+class IVFInnerProductIndex:
+    """
+    Inverted-file index for maximum inner product search over item embeddings.
+
+    Inner products are turned into cosine similarities by appending to every item vector the extra
+    coordinate sqrt(M^2 - ||x||^2), where M is the largest item norm, and a zero to every query vector.
+    The augmented item vectors are clustered with spherical k-means and every item is stored in the
+    inverted list of its closest centroid. At query time, only the `nprobe` lists whose centroids are
+    the most similar to the query are scored exactly.
+    """
+
+    def __init__(self, item_index: np.ndarray, item_vectors: np.ndarray, centroids: np.ndarray,
+                 list_indptr: np.ndarray) -> None:
+        # items are sorted by inverted list: list p holds the rows list_indptr[p]:list_indptr[p + 1]
+        self.item_index = item_index
+        self.item_vectors = item_vectors
+        self.centroids = centroids
+        self.list_indptr = list_indptr
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, item_embeddings: np.ndarray, n_lists: Optional[int] = None, n_iter: int = 20,
+              skip_padding: bool = True, seed: int = 0) -> "IVFInnerProductIndex":
+        """
+        Builds the index.
+
+        :param item_embeddings: item embedding matrix (items x dimensions)
+        :param n_lists: number of inverted lists (defaults to the square root of the number of items)
+        :param n_iter: number of k-means iterations
+        :param skip_padding: whether the first row is the padding item of RecBole and must not be indexed
+        :param seed: seed of the k-means initialization
+        :return: the built index
+        """
+        start = 1 if skip_padding else 0
+        item_index = np.arange(start, len(item_embeddings))
+        vectors = np.asarray(item_embeddings[start:], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        extra = np.sqrt(np.maximum(norms.max() ** 2 - norms ** 2, 0))
+        augmented = np.hstack([vectors, extra[:, None]]) / max(norms.max(), 1e-12)
+
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        rng = np.random.default_rng(seed)
+        centroids = augmented[rng.choice(len(augmented), n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = np.argmax(augmented @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, augmented)
+            counts = np.bincount(assignment, minlength=n_lists)
+            # empty lists keep their previous centroid
+            non_empty = counts > 0
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        assignment = np.argmax(augmented @ centroids.T, axis=1)
+
+        order = np.argsort(assignment, kind="stable")
+        list_indptr = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=n_lists), out=list_indptr[1:])
+        # the query has a zero extra coordinate, so the last coordinate of the centroids can be dropped
+        return cls(item_index[order], vectors[order], centroids[:, :-1].astype(np.float32), list_indptr)
+
+    def save(self, index_dir: str, source_fingerprint: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        for name in ("item_index", "item_vectors", "centroids", "list_indptr"):
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(index_dir, "meta.json"), "w") as f:
+            json.dump({"model_sha256": source_fingerprint}, f)
+
+    @classmethod
+    def load(cls, index_dir: str, source_fingerprint: str) -> Optional["IVFInnerProductIndex"]:
+        """
+        Loads the index saved in the given directory.
+
+        :param index_dir: directory where the index has been saved
+        :param source_fingerprint: hash of the model the index should have been built from
+        :return: the loaded index, or None if it is missing or built from a different model
+        """
+        try:
+            with open(os.path.join(index_dir, "meta.json"), "r") as f:
+                if json.load(f)["model_sha256"] != source_fingerprint:
+                    return None
+            return cls(**{name: np.load(os.path.join(index_dir, f"{name}.npy"))
+                          for name in ("item_index", "item_vectors", "centroids", "list_indptr")})
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int = ANN_NPROBE, exclude=None) -> np.ndarray:
+        """
+        Searches the items with the highest inner product with each query.
+
+        :param queries: query vectors (queries x dimensions), e.g., user embeddings
+        :param k: number of items to be returned for each query
+        :param nprobe: number of inverted lists scanned for each query
+        :param exclude: optional list with, for each query, the array of item indices to be excluded
+        (e.g., the items the user already interacted with)
+        :return: matrix (queries x k) of item indices sorted by decreasing score, padded with -1 when
+        the scanned lists contain fewer than k items
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        nprobe = min(nprobe, self.n_lists)
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        result = np.full((len(queries), k), -1, dtype=np.int64)
+        for q, query in enumerate(queries):
+            positions = np.concatenate([
+                np.arange(self.list_indptr[p], self.list_indptr[p + 1]) for p in probes[q]
+            ])
+            candidates = self.item_index[positions]
+            scores = self.item_vectors[positions] @ query
+            if exclude is not None and len(exclude[q]):
+                scores[np.isin(candidates, exclude[q])] = -np.inf
+            n = min(k, len(candidates))
+            if n == 0:
+                continue
+            top = np.argpartition(-scores, n - 1)[:n]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            top = top[np.isfinite(scores[top])]
+            result[q, :len(top)] = candidates[top]
+        return result
@@ -1,3 +1,5 @@
+import os
+
 JSON_GENERATION_ERROR = {
     "status": "failure",
     "message": "Something went wrong in the tool call process. The LLM-generated JSON "
@@ -5,7 +7,31 @@ JSON_GENERATION_ERROR = {
 }
 
 DATABASE_NAME = "movielens-100k"
+# columns of the items table, in the order in which they are stored
+ITEM_COLUMNS = [
+    "item_id", "title", "genres", "director", "producer", "actors", "release_date", "release_month",
+    "country", "duration", "age_rating", "imdb_rating", "imdb_num_reviews", "n_ratings", "n_ratings_kid",
+    "n_ratings_teenager", "n_ratings_young_adult", "n_ratings_adult", "n_ratings_senior", "n_ratings_male",
+    "n_ratings_female", "description", "storyline"
+]
 COLLECTION_NAME = "movielens-storyline"
+EMBEDDING_MODEL_NAME = "paraphrase-MiniLM-L6-v2"
+QDRANT_URL = "http://localhost:6333"
+# where the vectors of the movie descriptions are stored and searched: "qdrant" for the Qdrant server at
+# QDRANT_URL (started in Docker), "qdrant_local" for Qdrant's local mode on the directory QDRANT_PATH, or "numpy"
+# for an exact in-process index saved in VECTOR_INDEX_DIR. The last two do not need Docker
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+QDRANT_PATH = os.getenv("QDRANT_PATH", "./qdrant_local")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "./cache/vector_index")
+# number of texts encoded together by the embedding model when the vector store is created
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+# number of worker processes encoding the texts (1 encodes in the calling process). The workers are spawned,
+# so more than one requires the entry point of the application to be guarded by `if __name__ == "__main__"`
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", 1))
+# number of points sent to the vector store in each upsert request
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", 256))
+# maximum number of rows of each SQL result printed to stdout (0 disables result logging)
+SQL_RESULT_LOG_LIMIT = int(os.getenv("SQL_RESULT_LOG_LIMIT", 10))
 
 SYSTEM_MESSAGE = [
     {"role": "system", "content": """You are a helpful recommendation assistant. You have access to the following list
@@ -13,6 +39,8 @@ SYSTEM_MESSAGE = [
                                         - item_filter: useful to filter items based on content features (e.g., 
                                         movie genres, actors, etc.). Particularly useful for constrained recommendations.
                                         - get_top_k_recommendations: to be used when the user asks for recommendations.
+                                        - get_top_k_recommendations_batch: to be used when the user asks for 
+                                        recommendations for several users at once.
                                         - get_interacted_items: to be used to get the historical interactions of a 
                                         given user. Particularly useful for explaining recommendations.
                                         - get_item_metadata: to be used to get the metadata of items given their IDs.
@@ -26,7 +54,12 @@ SYSTEM_MESSAGE = [
                                         computation to those items.
                                         - vector_store_search: to be used to perform searches into a vector store 
                                         database. Particularly useful for user's mood-based recommendations, 
-                                        recommendations by similar items or storyline/description.
+                                        recommendations by storyline/description.
+                                        - vector_store_search_batch: to be used to perform several vector store 
+                                        searches at once (e.g., one for each of the moods of the user).
+                                        - get_similar_items: to be used to get the items most similar to a given 
+                                        item, by storyline or by the users who liked them. Particularly useful for 
+                                        recommendations by similar items.
 
                                 🔹 **GENERAL RULES**
 
@@ -40,7 +73,7 @@ SYSTEM_MESSAGE = [
 2. Recommend to user 2 popular teenager content. Tool calls: get_popular_items -> get_top_k_recommendations -> get_item_metadata.
 3. Recommend to user 89 content that is popular in his age category. Tool calls: get_user_metadata -> get_popular_items -> get_top_k_recommendations -> get_item_metadata.
 4. User 5 is depressed today, what could we recommend him? Tool calls: vector_store_search -> get_top_k_recommendations -> get_item_metadata.
-5. Recommend to user 2 movies that are similar to movie 56. Tool calls: get_item_metadata -> vector_store_search -> get_top_k_recommendations -> get_item_metadata.
+5. Recommend to user 2 movies that are similar to movie 56. Tool calls: get_similar_items -> get_top_k_recommendations -> get_item_metadata.
 6. Recommend to user 9 some movies where the main character pilots war flights. Tool calls: vector_store_search -> get_top_k_recommendations -> get_item_metadata.
 7. What are the title and release date of movie 9? Tool calls: get_item_metadata.
 8. What is the gender of user 4? Tool calls: get_user_metadata.
@@ -177,7 +210,7 @@ SYSTEM_MESSAGE_ENHANCED = [
         | Recommend to user 2 popular teenager content                     | `get_popular_items` → `get_top_k_recommendations` → `get_item_metadata`        |
         | Recommend to user 89 content popular in their age group          | `get_user_metadata` → `get_popular_items` → `get_top_k_recommendations`        |
         | User 5 is depressed today. What should we recommend?             | `vector_store_search` → `get_top_k_recommendations` → `get_item_metadata`      |
-        | Recommend to user 2 movies similar to movie 56                   | `get_item_metadata` → `vector_store_search` → `get_top_k_recommendations`      |
+        | Recommend to user 2 movies similar to movie 56                   | `get_similar_items` → `get_top_k_recommendations` → `get_item_metadata`        |
         | Recommend to user 9 some movies about war pilots                 | `vector_store_search` → `get_top_k_recommendations` → `get_item_metadata`      |
         | What are the title and release date of movie 9?                  | `get_item_metadata`                                                             |
         | What is the gender of user 4?                                    | `get_user_metadata`                                                             |
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Iterable, List, Optional
+from src.constants import DATABASE_NAME
+
+
+class SQLiteConnectionPool:
+    """
+    Thread-safe pool of SQLite connections. Every thread gets its own connection, which is opened
+    lazily and reused for all the following queries of that thread. Connections are opened through
+    read-only URIs, so the tools can never modify the database, and keep a cache of prepared
+    statements that is reused whenever the same SQL text is executed again. The journal mode is
+    owned by `create_ml100k_db`, which switches the database to WAL when it builds it.
+    """
+
+    def __init__(self, database: str = f"{DATABASE_NAME}.db", cached_statements: int = 256) -> None:
+        self.database = database
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        path = os.path.abspath(self.database)
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns the connection of the calling thread, opening it if needed.
+
+        :return: SQLite connection owned by the calling thread
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def execute(self, sql_query: str, params: Iterable = ()) -> List[tuple]:
+        """
+        Executes the given query on the connection of the calling thread.
+
+        :param sql_query: SQL query string, possibly with "?" placeholders
+        :param params: values bound to the placeholders of the query
+        :return: rows returned by the query
+        """
+        cursor = self.connection().execute(sql_query, tuple(params))
+        try:
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def close_all(self) -> None:
+        """
+        Closes all the connections opened by the pool. Threads will transparently open a new
+        connection on their next query.
+        """
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._local = threading.local()
+
+
+_pool: Optional[SQLiteConnectionPool] = None
+_pool_lock = threading.Lock()
+_rebuild_callbacks: List[Callable[[], None]] = []
+
+
+def get_connection_pool() -> SQLiteConnectionPool:
+    """
+    Returns the process-wide read-only connection pool of the application database.
+
+    :return: the shared connection pool
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SQLiteConnectionPool()
+    return _pool
+
+
+def register_rebuild_callback(callback: Callable[[], None]) -> None:
+    """
+    Registers a function that is called every time the database is rebuilt. It is used by the
+    in-memory structures derived from the database to drop their stale content.
+
+    :param callback: function without arguments
+    """
+    if callback not in _rebuild_callbacks:
+        _rebuild_callbacks.append(callback)
+
+
+def database_rebuilt() -> None:
+    """
+    It has to be called after the database file is rebuilt. It closes all the pooled connections, so
+    that no connection keeps reading a stale file, and notifies the registered callbacks.
+    """
+    if _pool is not None:
+        _pool.close_all()
+    for callback in _rebuild_callbacks:
+        callback()
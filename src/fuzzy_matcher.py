@@ -0,0 +1,147 @@
+import os
+import json
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from rapidfuzz import process, fuzz
+
+CACHE_DIR = "./cache/fuzzy"
+# number of candidates sharing the most trigrams with the query that are scored by the fuzzy scorer
+FUZZY_SHORTLIST_SIZE = int(os.getenv("FUZZY_SHORTLIST_SIZE", 100))
+# number of corrections memoized by every matcher
+FUZZY_CACHE_SIZE = int(os.getenv("FUZZY_CACHE_SIZE", 4096))
+N_GRAM = 3
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalizes a name for matching: accents are removed, the case is folded, and whitespace is
+    collapsed, so that, e.g., "Nagisa  Ôshima" and "nagisa oshima" are the same name.
+
+    :param name: name to be normalized
+    :return: normalized name
+    """
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def n_grams(name: str, n: int = N_GRAM) -> List[str]:
+    """
+    :param name: normalized name
+    :param n: length of the grams
+    :return: distinct character n-grams of the name padded with spaces, so that short names have at
+    least one gram
+    """
+    padded = f" {name} "
+    return list({padded[i:i + n] for i in range(max(1, len(padded) - n + 1))})
+
+
+class FuzzyMatcher:
+    """
+    Fuzzy matcher of a fixed list of names (e.g., all the actors of the catalog).
+
+    The names are normalized once and indexed by character trigrams: every trigram points to the
+    sorted list of the names containing it (CSR format). A query is first answered by an exact lookup
+    of its normalized form; otherwise, the names sharing the most trigrams with the query are
+    shortlisted and only these are scored with the fuzzy scorer, so the cost of a lookup does not
+    grow with the full list. Corrections are memoized in a bounded LRU cache.
+    """
+
+    def __init__(self, names: Iterable[str], normalized: Optional[List[str]] = None,
+                 grams: Optional[np.ndarray] = None, indptr: Optional[np.ndarray] = None,
+                 indices: Optional[np.ndarray] = None, shortlist_size: int = FUZZY_SHORTLIST_SIZE,
+                 cache_size: int = FUZZY_CACHE_SIZE) -> None:
+        # the preprocessed arrays are given only when loading a saved matcher, in the same order as the names
+        self.names = np.asarray(sorted(set(names)) if grams is None else list(names), dtype=str)
+        self.normalized = normalized if normalized is not None else \
+            [normalize_name(name) for name in self.names.tolist()]
+        if grams is None:
+            grams, indptr, indices = self._build_grams(self.normalized)
+        self.grams, self.indptr, self.indices = grams, indptr, indices
+        self._gram_ids = {gram: i for i, gram in enumerate(grams.tolist())}
+        self._exact = {}
+        for i, name in enumerate(self.normalized):
+            self._exact.setdefault(name, i)
+        self.shortlist_size = shortlist_size
+        self._correct = lru_cache(maxsize=cache_size)(self._match)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def _build_grams(normalized: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        pairs = [(gram, i) for i, name in enumerate(normalized) for gram in n_grams(name)]
+        grams, gram_ids = np.unique(np.asarray([gram for gram, _ in pairs], dtype=str), return_inverse=True)
+        name_ids = np.asarray([i for _, i in pairs], dtype=np.int32)
+        order = np.lexsort((name_ids, gram_ids))
+        indptr = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(gram_ids, minlength=len(grams)), out=indptr[1:])
+        return grams, indptr, name_ids[order]
+
+    def shortlist(self, normalized_query: str) -> np.ndarray:
+        """
+        :param normalized_query: normalized query
+        :return: indices of the names sharing the most trigrams with the query
+        """
+        ids = [self._gram_ids[gram] for gram in n_grams(normalized_query) if gram in self._gram_ids]
+        if not ids:
+            return np.empty(0, dtype=np.int32)
+        candidates, shared = np.unique(
+            np.concatenate([self.indices[self.indptr[g]:self.indptr[g + 1]] for g in ids]), return_counts=True
+        )
+        if len(candidates) > self.shortlist_size:
+            # sorted again, so that ties of the fuzzy scorer are broken by name as in the full list
+            candidates = np.sort(candidates[np.argpartition(-shared, self.shortlist_size - 1)[:self.shortlist_size]])
+        return candidates
+
+    def _match(self, name: str) -> Tuple[Optional[str], float]:
+        normalized = normalize_name(name)
+        if normalized in self._exact:
+            return self.names[self._exact[normalized]], 100.0
+        candidates = self.shortlist(normalized)
+        if len(candidates) == 0:
+            return None, 0.0
+        _, score, j = process.extractOne(normalized, [self.normalized[i] for i in candidates.tolist()],
+                                         scorer=fuzz.WRatio)
+        return self.names[candidates[j]], score
+
+    def correct(self, name: str, threshold: float = 70) -> Optional[str]:
+        """
+        Returns the name of the list that best matches the given one, if its score is above the threshold.
+
+        :param name: name to be corrected
+        :param threshold: minimum score (0-100) of the match
+        :return: the matched name, or None
+        """
+        match, score = self._correct(name)
+        return str(match) if match is not None and score >= threshold else None
+
+    def save(self, path: str, source_signature: list) -> None:
+        """
+        Saves the preprocessed names, together with the signature of the file they have been extracted
+        from, which is used to detect a stale matcher.
+
+        :param path: path of the .npz file
+        :param source_signature: JSON-serializable signature of the source file (e.g., size and mtime)
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, names=self.names, normalized=np.asarray(self.normalized, dtype=str), grams=self.grams,
+                 indptr=self.indptr, indices=self.indices, meta=np.asarray(json.dumps({"source": source_signature})))
+
+    @classmethod
+    def load(cls, path: str, source_signature: list) -> Optional["FuzzyMatcher"]:
+        """
+        :param path: path of the .npz file
+        :param source_signature: signature of the source file the matcher should have been built from
+        :return: the loaded matcher, or None if it is missing or stale
+        """
+        try:
+            with np.load(path) as data:
+                if json.loads(str(data["meta"]))["source"] != source_signature:
+                    return None
+                return cls(data["names"].tolist(), data["normalized"].tolist(), data["grams"], data["indptr"],
+                           data["indices"])
+        except (OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,146 @@
+import os
+import json
+import threading
+from typing import Iterable, Optional
+import numpy as np
+from src.database import get_connection_pool, register_rebuild_callback
+from src.utils import get_time, RATINGS_FILE
+
+INDEX_DIR = "./data/ml-100k/interaction_index"
+
+
+class InteractionIndex:
+    """
+    Sparse user-item interaction matrix stored in CSC format, namely, for every item, the sorted list
+    of the (internal) indices of the users that interacted with it. The arrays are persisted to disk
+    as .npy files and memory-mapped when loaded, so the index is built only once and opening it does
+    not depend on the size of the ratings file.
+    """
+
+    def __init__(self, item_ids: np.ndarray, user_ids: np.ndarray, indptr: np.ndarray,
+                 indices: np.ndarray) -> None:
+        self.item_ids = item_ids
+        self.user_ids = user_ids
+        self.indptr = indptr
+        self.indices = indices
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_ids)
+
+    @classmethod
+    def build(cls) -> "InteractionIndex":
+        """
+        Builds the index from the interactions table of the database. The pairs are read through the
+        covering index on (item_id, user_id), so they are already sorted by item and then by user.
+
+        :return: the built index
+        """
+        rows = get_connection_pool().execute(
+            "SELECT item_id, user_id FROM interactions ORDER BY item_id, user_id"
+        )
+        pairs = np.asarray(rows, dtype=np.int64).reshape(-1, 2)
+        item_ids, items = np.unique(pairs[:, 0], return_inverse=True)
+        user_ids, users = np.unique(pairs[:, 1], return_inverse=True)
+        indptr = np.zeros(len(item_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(items, minlength=len(item_ids)), out=indptr[1:])
+        return cls(item_ids, user_ids, indptr, users.astype(np.int32))
+
+    def save(self, index_dir: str, source_path: str) -> None:
+        """
+        Saves the index arrays to the given directory, together with the size and modification time of
+        the source ratings file of the interactions table, which are used to detect a stale index.
+
+        :param index_dir: directory where the arrays are saved
+        :param source_path: path of the ratings file the interactions table has been built from
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        for name in ("item_ids", "user_ids", "indptr", "indices"):
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        stat = os.stat(source_path)
+        with open(os.path.join(index_dir, "meta.json"), "w") as f:
+            json.dump({"source_size": stat.st_size, "source_mtime_ns": stat.st_mtime_ns}, f)
+
+    @classmethod
+    def load(cls, index_dir: str, source_path: str) -> Optional["InteractionIndex"]:
+        """
+        Memory-maps the index saved in the given directory.
+
+        :param index_dir: directory where the arrays have been saved
+        :param source_path: path of the ratings file the interactions table has been built from
+        :return: the loaded index, or None if it is missing or older than the ratings file
+        """
+        try:
+            with open(os.path.join(index_dir, "meta.json"), "r") as f:
+                meta = json.load(f)
+            stat = os.stat(source_path)
+            if meta["source_size"] != stat.st_size or meta["source_mtime_ns"] != stat.st_mtime_ns:
+                return None
+            arrays = {
+                name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+                for name in ("item_ids", "user_ids", "indptr", "indices")
+            }
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(**arrays)
+
+    def count_users(self, items: Iterable) -> int:
+        """
+        Counts the distinct users that interacted with at least one of the given items, namely, the
+        number of non-empty rows in the union of the item columns.
+
+        :param items: item IDs
+        :return: number of distinct users
+        """
+        items = np.unique(np.asarray([int(i) for i in items], dtype=np.int64))
+        pos = np.searchsorted(self.item_ids, items)
+        found = pos < len(self.item_ids)
+        pos = pos[found]
+        pos = pos[self.item_ids[pos] == items[found]]
+        if len(pos) == 0:
+            return 0
+        starts, ends = self.indptr[pos], self.indptr[pos + 1]
+        lengths = ends - starts
+        # positions of all the entries of the selected columns, gathered without a Python loop
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        seen = np.zeros(self.n_users, dtype=bool)
+        seen[self.indices[offsets]] = True
+        return int(np.count_nonzero(seen))
+
+
+_index: Optional[InteractionIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_interaction_index() -> InteractionIndex:
+    """
+    Returns the process-wide interaction index. It is loaded from disk if it is up to date with the
+    ratings file, otherwise it is rebuilt from the database and saved.
+
+    :return: the shared interaction index
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = InteractionIndex.load(INDEX_DIR, RATINGS_FILE)
+                if index is None:
+                    print(f"\n{get_time()} - Building interaction index from the interactions table.\n")
+                    built = InteractionIndex.build()
+                    built.save(INDEX_DIR, RATINGS_FILE)
+                    index = InteractionIndex.load(INDEX_DIR, RATINGS_FILE) or built
+                _index = index
+    return _index
+
+
+def refresh_interaction_index() -> None:
+    """
+    Drops the loaded interaction index, so that it is checked against the ratings file again on the
+    next access.
+    """
+    global _index
+    with _index_lock:
+        _index = None
+
+
+register_rebuild_callback(refresh_interaction_index)
@@ -0,0 +1,125 @@
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from src.constants import DATABASE_NAME, ITEM_COLUMNS
+from src.database import SQLiteConnectionPool, register_rebuild_callback
+from src.utils import get_time, read_ml100k_items
+
+
+class ItemCatalog:
+    """
+    Columnar in-memory copy of the items table. Each column is stored as a NumPy array aligned with
+    the sorted array of item IDs, so that metadata lookups and popularity computations are answered
+    with vectorized gathers instead of SQL queries. Columns without missing values are stored with a
+    numeric dtype, the others as object arrays holding the original Python values (None included).
+    """
+
+    def __init__(self, rows: List[tuple], columns: List[str] = ITEM_COLUMNS) -> None:
+        rows = sorted(rows, key=lambda row: row[0])
+        self.columns = {}
+        for i, column in enumerate(columns):
+            values = [row[i] for row in rows]
+            if values and all(isinstance(v, (int, float)) for v in values):
+                self.columns[column] = np.asarray(values)
+            else:
+                col = np.empty(len(values), dtype=object)
+                col[:] = values
+                self.columns[column] = col
+        self.item_ids = self.columns["item_id"].astype(np.int64)
+
+    @classmethod
+    def from_database(cls, database: str = f"{DATABASE_NAME}.db") -> "ItemCatalog":
+        """
+        Loads the catalog from the items table of the given SQLite database.
+
+        :param database: path to the SQLite database
+        :return: the loaded catalog
+        """
+        pool = SQLiteConnectionPool(database)
+        try:
+            rows = pool.execute(f"SELECT {', '.join(ITEM_COLUMNS)} FROM items")
+        finally:
+            pool.close_all()
+        return cls(rows)
+
+    @classmethod
+    def from_csv(cls) -> "ItemCatalog":
+        """
+        Loads the catalog directly from the MovieLens-100k item metadata file.
+
+        :return: the loaded catalog
+        """
+        # the file may contain duplicated item IDs: keep the first occurrence as INSERT OR IGNORE does
+        rows = {}
+        for row in read_ml100k_items():
+            rows.setdefault(row[0], row)
+        return cls(list(rows.values()))
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    def positions(self, items: Iterable) -> np.ndarray:
+        """
+        Maps the given item IDs to their positions in the column arrays. Unknown IDs are dropped and
+        duplicates are removed, so the returned positions are sorted by item ID as in a SQL query.
+
+        :param items: item IDs
+        :return: array of positions
+        """
+        items = np.unique(np.asarray([int(i) for i in items], dtype=np.int64))
+        pos = np.searchsorted(self.item_ids, items)
+        found = pos < len(self.item_ids)
+        pos = pos[found]
+        return pos[self.item_ids[pos] == items[found]]
+
+    def get_metadata(self, items: Iterable, fields: List[str]) -> Dict[int, Dict[str, object]]:
+        """
+        Returns the requested metadata of the given items.
+
+        :param items: item IDs
+        :param fields: names of the requested columns
+        :return: dictionary {item_id: {field: value}}, where missing values are None
+        """
+        pos = self.positions(items)
+        gathered = {field: self.columns[field][pos].tolist() for field in fields}
+        return {
+            item_id: {field: gathered[field][j] for field in fields}
+            for j, item_id in enumerate(self.item_ids[pos].tolist())
+        }
+
+
+_catalog: Optional[ItemCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_item_catalog() -> ItemCatalog:
+    """
+    Returns the process-wide item catalog. It is loaded from the database the first time it is
+    requested, or from the item metadata file if the database has not been built yet.
+
+    :return: the shared item catalog
+    """
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                if os.path.exists(f"{DATABASE_NAME}.db"):
+                    _catalog = ItemCatalog.from_database()
+                else:
+                    _catalog = ItemCatalog.from_csv()
+                print(f"\n{get_time()} - Loaded item catalog with {len(_catalog)} items.\n")
+    return _catalog
+
+
+def refresh_item_catalog() -> None:
+    """
+    Drops the loaded item catalog, so that it is reloaded on the next request. It is called
+    automatically every time the database is rebuilt.
+    """
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
+
+
+register_rebuild_callback(refresh_item_catalog)
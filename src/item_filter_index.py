@@ -0,0 +1,190 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from src.database import register_rebuild_callback
+from src.item_catalog import ItemCatalog, get_item_catalog
+from src.utils import get_time, read_ml100k_item_lists
+
+# textual filter features and the list columns of the item metadata file they are indexed from. The
+# country is a single value, taken from the items table
+TEXTUAL_FEATURES = {
+    "genres": "genres_list",
+    "actors": "actors_list",
+    "director": "directors_list",
+    "producer": "producers_list",
+    "country": None,
+}
+# numeric filter features, answered by binary search on the sorted columns of the catalog
+NUMERIC_FEATURES = ("release_date", "release_month", "duration", "imdb_rating")
+
+
+def to_bitset(positions: np.ndarray, size: int) -> np.ndarray:
+    """
+    Builds a bitset of the given size where the bits at the given positions are set.
+
+    :param positions: positions of the set bits
+    :param size: number of bits
+    :return: packed bitset (uint8 array of ceil(size / 8) bytes)
+    """
+    bits = np.zeros(size, dtype=bool)
+    bits[positions] = True
+    return np.packbits(bits)
+
+
+def from_bitset(bitset: np.ndarray, size: int) -> np.ndarray:
+    """
+    Returns the positions of the set bits of a packed bitset.
+
+    :param bitset: packed bitset
+    :param size: number of bits
+    :return: sorted array of positions
+    """
+    return np.flatnonzero(np.unpackbits(bitset, count=size))
+
+
+class ItemFilterIndex:
+    """
+    In-memory filter engine over the item catalog.
+
+    For every (lowercased) genre, actor, director, producer, and country, it keeps the posting list
+    of the catalog positions of the items that have it, stored as a packed bitset. Names are matched
+    exactly, so "Ford" does not match "Harrison Fordham". Every numeric feature is stored sorted by
+    value together with the positions of the items, so a range predicate is turned into a bitset by
+    two binary searches. Conjunctive filters are answered by AND-ing the bitsets.
+    """
+
+    def __init__(self, item_ids: np.ndarray, postings: Dict[str, Dict[str, np.ndarray]],
+                 sorted_columns: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> None:
+        # item_ids are the sorted IDs of the catalog, bit i of every bitset refers to item_ids[i]
+        self.item_ids = item_ids
+        self.postings = postings
+        # feature -> (sorted values, positions of the items holding them), items without a value are left out
+        self.sorted_columns = sorted_columns
+
+    @property
+    def size(self) -> int:
+        return len(self.item_ids)
+
+    @classmethod
+    def build(cls, catalog: ItemCatalog, item_lists: Dict[int, Dict[str, List[str]]]) -> "ItemFilterIndex":
+        """
+        Builds the index.
+
+        :param catalog: item catalog, which defines the item positions
+        :param item_lists: list columns of every item, as returned by `read_ml100k_item_lists`
+        :return: the built index
+        """
+        item_ids = catalog.item_ids
+        positions = {}
+        for feature, column in TEXTUAL_FEATURES.items():
+            names = {}
+            if column is None:
+                for pos, value in enumerate(catalog.columns[feature].tolist()):
+                    if value is not None:
+                        names.setdefault(value.strip().lower(), []).append(pos)
+            else:
+                for pos, item_id in enumerate(item_ids.tolist()):
+                    for name in item_lists.get(item_id, {}).get(column, []):
+                        names.setdefault(name.lower(), []).append(pos)
+            positions[feature] = names
+        postings = {
+            feature: {name: to_bitset(np.asarray(pos, dtype=np.int64), len(item_ids)) for name, pos in names.items()}
+            for feature, names in positions.items()
+        }
+        sorted_columns = {}
+        for feature in NUMERIC_FEATURES:
+            values = catalog.columns[feature]
+            known = np.flatnonzero(np.asarray([v is not None for v in values.tolist()], dtype=bool))
+            known_values = values[known].astype(np.float64)
+            order = np.argsort(known_values, kind="stable")
+            sorted_columns[feature] = (known_values[order], known[order])
+        return cls(item_ids, postings, sorted_columns)
+
+    def bitset(self, feature: str, name: str) -> np.ndarray:
+        """
+        :param feature: textual feature (e.g., actors)
+        :param name: name to be matched, case-insensitively
+        :return: bitset of the items having the given name, empty if the name is unknown
+        """
+        posting = self.postings[feature].get(name.strip().lower())
+        return posting if posting is not None else np.zeros((self.size + 7) // 8, dtype=np.uint8)
+
+    def range_bitset(self, feature: str, request: str, threshold: float) -> np.ndarray:
+        """
+        :param feature: numeric feature (e.g., imdb_rating)
+        :param request: "higher" (value > threshold), "lower" (value < threshold), or "exact"
+        (value = threshold)
+        :param threshold: threshold of the comparison
+        :return: bitset of the items satisfying the comparison. Items without a value never satisfy it
+        """
+        values, positions = self.sorted_columns[feature]
+        if request == "higher":
+            selected = positions[np.searchsorted(values, threshold, side="right"):]
+        elif request == "lower":
+            selected = positions[:np.searchsorted(values, threshold, side="left")]
+        else:
+            selected = positions[np.searchsorted(values, threshold, side="left"):
+                                 np.searchsorted(values, threshold, side="right")]
+        return to_bitset(selected, self.size)
+
+    def match_bitset(self, conditions: Iterable[Tuple[str, str]] = (),
+                     ranges: Iterable[Tuple[str, str, float]] = ()) -> Optional[np.ndarray]:
+        """
+        Returns the bitset of the items satisfying all the given conditions.
+
+        :param conditions: (feature, name) pairs, e.g., [("actors", "Harrison Ford"), ("genres", "Action")]
+        :param ranges: (feature, request, threshold) triples, e.g., [("imdb_rating", "higher", 7)]
+        :return: packed bitset over the catalog positions, or None if no condition is given
+        """
+        bitsets = [self.bitset(feature, name) for feature, name in conditions]
+        bitsets += [self.range_bitset(feature, request, threshold) for feature, request, threshold in ranges]
+        if not bitsets:
+            return None
+        return np.bitwise_and.reduce(bitsets, axis=0) if len(bitsets) > 1 else bitsets[0].copy()
+
+    def match(self, conditions: Iterable[Tuple[str, str]] = (),
+              ranges: Iterable[Tuple[str, str, float]] = ()) -> Optional[np.ndarray]:
+        """
+        Returns the items satisfying all the given conditions.
+
+        :param conditions: (feature, name) pairs, e.g., [("actors", "Harrison Ford"), ("genres", "Action")]
+        :param ranges: (feature, request, threshold) triples, e.g., [("imdb_rating", "higher", 7)]
+        :return: sorted array of item IDs, or None if no condition is given
+        """
+        result = self.match_bitset(conditions, ranges)
+        if result is None:
+            return None
+        return self.item_ids[from_bitset(result, self.size)]
+
+
+_index: Optional[ItemFilterIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_item_filter_index() -> ItemFilterIndex:
+    """
+    Returns the process-wide item filter index, built from the item catalog the first time it is
+    requested.
+
+    :return: the shared item filter index
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ItemFilterIndex.build(get_item_catalog(), read_ml100k_item_lists())
+                print(f"\n{get_time()} - Built item filter index over {_index.size} items.\n")
+    return _index
+
+
+def refresh_item_filter_index() -> None:
+    """
+    Drops the item filter index, so that it is rebuilt on the next request. It is called
+    automatically every time the database is rebuilt.
+    """
+    global _index
+    with _index_lock:
+        _index = None
+
+
+register_rebuild_callback(refresh_item_filter_index)
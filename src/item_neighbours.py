@@ -0,0 +1,265 @@
+"""
+Item-item neighbour tables: for every item, the M most similar items and their cosine similarities,
+computed offline from either the storyline embeddings of the vector store or the item embeddings of
+the pre-trained BPR model.
+
+The tables are built the first time they are needed, or offline by running from the root of the
+repository:
+
+    python -m src.item_neighbours --source storyline --top_m 50
+"""
+import os
+import json
+import shutil
+import argparse
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from src.recsys_backends import exported_model_fingerprint
+from src.utils import get_time
+from src.vector_backends import get_vector_backend
+
+CACHE_DIR = "./cache/item_neighbours"
+# number of neighbours stored for every item
+ITEM_NEIGHBOURS_TOP_M = int(os.getenv("ITEM_NEIGHBOURS_TOP_M", 50))
+# "storyline" uses the vectors of the vector store, "bpr" the item embeddings exported to RECSYS_EMBEDDINGS_DIR
+NEIGHBOUR_SOURCES = ("storyline", "bpr")
+
+
+class ItemNeighbourTable:
+    """
+    Top-M neighbours of every item, stored as a (n_items, M) int32 matrix of item IDs padded with -1
+    and the matching float16 matrix of cosine similarities, both aligned with the sorted array of item
+    IDs. A similarity request is a binary search for the row of the item and a slice of that row.
+    """
+
+    def __init__(self, item_ids: np.ndarray, neighbours: np.ndarray, scores: np.ndarray) -> None:
+        self.item_ids = item_ids
+        self.neighbours = neighbours
+        self.scores = scores
+
+    @property
+    def top_m(self) -> int:
+        return self.neighbours.shape[1]
+
+    @classmethod
+    def build(cls, item_ids: np.ndarray, vectors: np.ndarray, top_m: int = ITEM_NEIGHBOURS_TOP_M,
+              block_size: int = 1024) -> "ItemNeighbourTable":
+        """
+        Computes the neighbours by exact cosine similarity, one block of items at a time, so that the
+        memory used does not grow with the square of the catalog.
+
+        :param item_ids: item IDs
+        :param vectors: vectors of the items (items x dimensions)
+        :param top_m: number of neighbours stored for every item
+        :param block_size: number of items whose similarities are computed together
+        :return: the built table
+        """
+        order = np.argsort(item_ids, kind="stable")
+        item_ids = np.asarray(item_ids, dtype=np.int64)[order]
+        vectors = np.asarray(vectors, dtype=np.float32)[order]
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        m = min(top_m, len(item_ids) - 1)
+        neighbours = np.full((len(item_ids), top_m), -1, dtype=np.int32)
+        scores = np.zeros((len(item_ids), top_m), dtype=np.float16)
+        if m <= 0:
+            return cls(item_ids, neighbours, scores)
+        for first in range(0, len(item_ids), block_size):
+            block = vectors[first:first + block_size] @ vectors.T
+            rows = np.arange(len(block))
+            # an item is never its own neighbour
+            block[rows, first + rows] = -np.inf
+            top = np.argpartition(-block, m - 1, axis=1)[:, :m]
+            top = np.take_along_axis(top, np.argsort(-np.take_along_axis(block, top, axis=1), kind="stable", axis=1),
+                                     axis=1)
+            neighbours[first:first + len(block), :m] = item_ids[top]
+            scores[first:first + len(block), :m] = np.take_along_axis(block, top, axis=1)
+        return cls(item_ids, neighbours, scores)
+
+    def save(self, table_dir: str, source_fingerprint: str) -> None:
+        os.makedirs(table_dir, exist_ok=True)
+        for name in ("item_ids", "neighbours", "scores"):
+            np.save(os.path.join(table_dir, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(table_dir, "meta.json"), "w") as f:
+            json.dump({"source_fingerprint": source_fingerprint, "top_m": self.top_m}, f)
+
+    @classmethod
+    def load(cls, table_dir: str, source_fingerprint: str) -> Optional["ItemNeighbourTable"]:
+        """
+        :param table_dir: directory where the table has been saved
+        :param source_fingerprint: fingerprint of the vectors the table should have been built from
+        :return: the memory-mapped table, or None if it is missing or built from different vectors
+        """
+        try:
+            with open(os.path.join(table_dir, "meta.json"), "r") as f:
+                if json.load(f)["source_fingerprint"] != source_fingerprint:
+                    return None
+            return cls(*[np.load(os.path.join(table_dir, f"{name}.npy"), mmap_mode="r")
+                         for name in ("item_ids", "neighbours", "scores")])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def lookup(self, item_id: int, k: int, items: Optional[List[int]] = None) -> Optional[List[Tuple[int, float]]]:
+        """
+        Returns the items most similar to the given one.
+
+        :param item_id: item ID
+        :param k: number of similar items to be returned
+        :param items: optional item IDs the similar items are restricted to. Only the stored top-M
+        neighbours are considered, so fewer than k items may be returned
+        :return: (item ID, similarity) pairs sorted by decreasing similarity, or None if the item is unknown
+        """
+        row = np.searchsorted(self.item_ids, item_id)
+        if row >= len(self.item_ids) or self.item_ids[row] != item_id:
+            return None
+        neighbours, scores = np.asarray(self.neighbours[row]), np.asarray(self.scores[row])
+        keep = neighbours >= 0
+        if items is not None:
+            keep &= np.isin(neighbours, np.asarray(items, dtype=np.int64))
+        return [(int(i), float(s)) for i, s in zip(neighbours[keep][:k].tolist(), scores[keep][:k].tolist())]
+
+
+def source_vectors(source: str) -> Tuple[np.ndarray, np.ndarray, str]:
+    """
+    Reads the vectors the neighbours of the given source are computed from.
+
+    :param source: "storyline" or "bpr"
+    :return: item IDs, item vectors, and the fingerprint of the vectors
+    """
+    if source == "storyline":
+        backend = get_vector_backend()
+        item_ids, vectors = backend.all_vectors()
+        return item_ids, vectors, backend.version()
+    if source == "bpr":
+        embeddings_dir = os.getenv("RECSYS_EMBEDDINGS_DIR")
+        # the first row is the padding item of RecBole
+        tokens = np.load(os.path.join(embeddings_dir, "item_tokens.npy"))[1:]
+        vectors = np.load(os.path.join(embeddings_dir, "item_embeddings.npy"))[1:]
+        return tokens.astype(np.int64), vectors, exported_model_fingerprint(embeddings_dir)
+    raise ValueError(f"Unknown neighbour source: {source}")
+
+
+def source_fingerprint(source: str) -> str:
+    """
+    :param source: "storyline" or "bpr"
+    :return: fingerprint of the current vectors of the given source, cheap to compute
+    """
+    if source == "storyline":
+        return get_vector_backend().version()
+    if source == "bpr":
+        embeddings_dir = os.getenv("RECSYS_EMBEDDINGS_DIR")
+        if embeddings_dir is None or not os.path.isfile(os.path.join(embeddings_dir, "meta.json")):
+            raise ValueError("The item embeddings of the recommendation model have not been exported, so only "
+                             "the storyline similarity is available. Run data/ml-100k/recsys_training.py to "
+                             "export them.")
+        return exported_model_fingerprint(embeddings_dir)
+    raise ValueError(f"Unknown neighbour source: {source}")
+
+
+def build_item_neighbours(source: str, top_m: int = ITEM_NEIGHBOURS_TOP_M) -> ItemNeighbourTable:
+    """
+    Computes the neighbour table of the given source and saves it in the cache directory, replacing
+    the tables built from previous versions of the vectors.
+
+    :param source: "storyline" or "bpr"
+    :param top_m: number of neighbours stored for every item
+    :return: the memory-mapped table
+    """
+    item_ids, vectors, fingerprint = source_vectors(source)
+    print(f"\n{get_time()} - Building top-{top_m} {source} neighbours of {len(item_ids)} items.\n")
+    table = ItemNeighbourTable.build(item_ids, vectors, top_m)
+    table_dir = os.path.join(CACHE_DIR, source)
+    shutil.rmtree(table_dir, ignore_errors=True)
+    table.save(table_dir, fingerprint)
+    return ItemNeighbourTable.load(table_dir, fingerprint) or table
+
+
+_tables: Dict[str, Tuple[str, ItemNeighbourTable]] = {}
+_tables_lock = threading.Lock()
+
+
+def get_item_neighbours(source: str) -> ItemNeighbourTable:
+    """
+    Returns the neighbour table of the given source. It is loaded from the cache directory, or built
+    if it is missing or has been built from vectors that have changed since.
+
+    :param source: "storyline" or "bpr"
+    :return: the neighbour table
+    """
+    fingerprint = source_fingerprint(source)
+    entry = _tables.get(source)
+    if entry is not None and entry[0] == fingerprint:
+        return entry[1]
+    with _tables_lock:
+        entry = _tables.get(source)
+        if entry is None or entry[0] != fingerprint:
+            table = ItemNeighbourTable.load(os.path.join(CACHE_DIR, source), fingerprint)
+            if table is None:
+                table = build_item_neighbours(source)
+            entry = (fingerprint, table)
+            _tables[source] = entry
+    return entry[1]
+
+
+def exact_similar_items(source: str, item_id: int, k: int, items: List[int]) -> List[Tuple[int, float]]:
+    """
+    Scores the given candidates against an item exactly, for the restricted requests that the stored
+    top-M neighbours cannot answer.
+
+    :param source: "storyline" or "bpr"
+    :param item_id: item ID
+    :param k: number of similar items to be returned
+    :param items: candidate item IDs
+    :return: (item ID, similarity) pairs sorted by decreasing similarity
+    """
+    candidates = [i for i in items if i != item_id]
+    if source == "storyline":
+        backend = get_vector_backend()
+        vector = backend.vector(item_id)
+        if vector is None:
+            return []
+        return [(int(hit["id"]), float(hit["score"])) for hit in backend.search(vector.tolist(), k, items=candidates)]
+    item_ids, vectors, _ = source_vectors(source)
+    positions = {i: p for p, i in enumerate(item_ids.tolist())}
+    rows = np.asarray([positions[i] for i in candidates if i in positions], dtype=np.int64)
+    if item_id not in positions or len(rows) == 0:
+        return []
+    query = np.asarray(vectors[positions[item_id]], dtype=np.float32)
+    selected = np.asarray(vectors[rows], dtype=np.float32)
+    scores = (selected @ query) / np.maximum(np.linalg.norm(selected, axis=1) * np.linalg.norm(query), 1e-12)
+    top = np.argsort(-scores, kind="stable")[:k]
+    return [(int(item_ids[rows[i]]), float(scores[i])) for i in top.tolist()]
+
+
+def similar_items(source: str, item_id: int, k: int, items: Optional[List[int]] = None) \
+        -> Optional[List[Tuple[int, float]]]:
+    """
+    Returns the items most similar to the given one, from the neighbour table of the given source.
+    When the request is restricted to some items and fewer than k of them are among the stored
+    neighbours, the candidates are scored exactly instead.
+
+    :param source: "storyline" or "bpr"
+    :param item_id: item ID
+    :param k: number of similar items to be returned
+    :param items: optional item IDs the similar items are restricted to
+    :return: (item ID, similarity) pairs sorted by decreasing similarity, or None if the item is unknown
+    """
+    similar = get_item_neighbours(source).lookup(item_id, k, items=items)
+    if similar is None or items is None or len(similar) >= min(k, len(set(items) - {item_id})):
+        return similar
+    return exact_similar_items(source, item_id, k, items)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=NEIGHBOUR_SOURCES, default="storyline", help="Vectors of the items")
+    parser.add_argument("--top_m", type=int, default=ITEM_NEIGHBOURS_TOP_M, help="Neighbours stored for every item")
+    args = parser.parse_args()
+    table = build_item_neighbours(args.source, args.top_m)
+    print(f"{get_time()} - Saved the neighbours of {len(table.item_ids)} items to {CACHE_DIR}/{args.source}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import threading
+from typing import Iterable, List, Optional
+import numpy as np
+from src.database import register_rebuild_callback
+from src.item_catalog import ItemCatalog, get_item_catalog
+from src.utils import get_time
+
+# user groups with a rating count column (n_ratings_<group>) in the items table
+USER_GROUPS = ("kid", "teenager", "young_adult", "adult", "senior", "male", "female")
+
+
+def group_mask(groups: Optional[Iterable[str]]) -> int:
+    """
+    :param groups: user groups, or None for the standard popularity
+    :return: bitmask of the given groups (bit i is set for USER_GROUPS[i]), 0 for the standard popularity
+    """
+    mask = 0
+    for group in groups or ():
+        mask |= 1 << USER_GROUPS.index(group)
+    return mask
+
+
+class PopularityIndex:
+    """
+    Precomputed popularity rankings of the catalog, one for the standard popularity (n_ratings) and one
+    for every combination of user groups (the sum of their n_ratings_<group> columns), indexed by the
+    bitmask of the groups.
+
+    Every ranking stores the catalog positions sorted by decreasing rating count (ties broken by item
+    ID), their counts, and the rank of every position. An unrestricted request is a prefix of a ranking,
+    whose length (the items above the 75th percentile of the counts) is also precomputed. A request
+    restricted to some items sorts only their ranks, so it does not scan the whole catalog.
+    """
+
+    def __init__(self, catalog: ItemCatalog, rankings: np.ndarray, ranked_counts: np.ndarray, ranks: np.ndarray,
+                 n_popular: np.ndarray) -> None:
+        # the catalog defines the item positions; row m of every matrix refers to the groups of bitmask m
+        self.catalog = catalog
+        self.rankings = rankings
+        self.ranked_counts = ranked_counts
+        self.ranks = ranks
+        # number of items whose count is higher than the 75th percentile of all the counts
+        self.n_popular = n_popular
+
+    @classmethod
+    def build(cls, catalog: ItemCatalog) -> "PopularityIndex":
+        """
+        Builds the rankings of all the combinations of user groups.
+
+        :param catalog: item catalog, which defines the item positions
+        :return: the built index
+        """
+        n_items = len(catalog.item_ids)
+        group_counts = np.stack([catalog.columns[f"n_ratings_{group}"].astype(np.int64) for group in USER_GROUPS])
+        n_masks = 1 << len(USER_GROUPS)
+        rankings = np.empty((n_masks, n_items), dtype=np.int32)
+        ranked_counts = np.empty((n_masks, n_items), dtype=np.int64)
+        ranks = np.empty((n_masks, n_items), dtype=np.int32)
+        n_popular = np.zeros(n_masks, dtype=np.int64)
+        bits = (np.arange(n_masks)[:, None] >> np.arange(len(USER_GROUPS))) & 1
+        all_counts = bits @ group_counts
+        all_counts[0] = catalog.columns["n_ratings"].astype(np.int64)
+        for mask, counts in enumerate(all_counts):
+            # the catalog is sorted by item ID, so the stable sort breaks ties by item ID
+            order = np.argsort(-counts, kind="stable")
+            rankings[mask] = order
+            ranked_counts[mask] = counts[order]
+            ranks[mask, order] = np.arange(n_items)
+            if n_items:
+                n_popular[mask] = np.count_nonzero(counts > np.quantile(counts, 0.75))
+        return cls(catalog, rankings, ranked_counts, ranks, n_popular)
+
+    def top_k(self, groups: Optional[Iterable[str]], k: int, items: Optional[Iterable] = None) -> List[str]:
+        """
+        Returns the most popular items, namely, the items whose rating count is higher than the 75th
+        percentile of the counts, sorted by decreasing count (ties broken by item ID) and truncated to k.
+
+        :param groups: user groups whose rating counts are summed, or None for the standard popularity
+        :param k: maximum number of items to be returned
+        :param items: optional item IDs to which the computation is restricted
+        :return: list of the IDs of the most popular items
+        """
+        mask = group_mask(groups)
+        if k <= 0:
+            return []
+        if items is None:
+            selected = self.rankings[mask, :min(k, self.n_popular[mask])]
+        else:
+            positions = self.catalog.positions(items)
+            if len(positions) == 0:
+                return []
+            walk = np.sort(self.ranks[mask, positions])
+            counts = self.ranked_counts[mask, walk]
+            # the counts of the walk are sorted, so the popular items are a prefix of it
+            n_popular = np.count_nonzero(counts > np.quantile(counts, 0.75))
+            selected = self.rankings[mask, walk[:min(k, n_popular)]]
+        return [str(i) for i in self.catalog.item_ids[selected].tolist()]
+
+
+_index: Optional[PopularityIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_popularity_index() -> PopularityIndex:
+    """
+    Returns the process-wide popularity index, built from the item catalog the first time it is
+    requested.
+
+    :return: the shared popularity index
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PopularityIndex.build(get_item_catalog())
+                print(f"\n{get_time()} - Built popularity rankings of {len(_index.rankings)} user group "
+                      f"combinations.\n")
+    return _index
+
+
+def refresh_popularity_index() -> None:
+    """
+    Drops the popularity index, so that it is rebuilt on the next request. It is called automatically
+    every time the database is rebuilt.
+    """
+    global _index
+    with _index_lock:
+        _index = None
+
+
+register_rebuild_callback(refresh_popularity_index)
@@ -0,0 +1,54 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe bounded mapping that evicts the least recently used entry when it is full. It counts
+    the hits and misses of the lookups, so its effectiveness can be monitored.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[object]:
+        """
+        :param key: key of the entry
+        :return: the cached value, or None if the key is not cached
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: object) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        :return: number of hits, misses, and cached entries, and the hit rate of the lookups
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,147 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from src.utils import get_time
+
+CACHE_DIR = "./cache/recommendations"
+# number of items cached in the ranking of each user
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", 100))
+
+_fingerprints = {}
+
+
+def model_fingerprint(model_path: str) -> str:
+    """
+    Computes the SHA-256 hash of the given model file. The hash is memoized on the size and
+    modification time of the file, so it is recomputed only when the file changes.
+
+    :param model_path: path to the model file
+    :return: hex digest of the file content
+    """
+    stat = os.stat(model_path)
+    key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _fingerprints:
+        sha = hashlib.sha256()
+        with open(model_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        _fingerprints[key] = sha.hexdigest()
+    return _fingerprints[key]
+
+
+class RecommendationCache:
+    """
+    Precomputed top-N full-catalog rankings of all the users, stored as a (n_users, N) array of item
+    IDs padded with -1, and memory-mapped from disk.
+    """
+
+    def __init__(self, user_ids: np.ndarray, rankings: np.ndarray) -> None:
+        self.user_ids = user_ids
+        self.rankings = rankings
+
+    @property
+    def top_n(self) -> int:
+        return self.rankings.shape[1]
+
+    @classmethod
+    def build(cls, users: List[str], recommend_fn: Callable[..., Dict[str, List[str]]],
+              top_n: int = RECOMMENDATION_CACHE_SIZE) -> "RecommendationCache":
+        """
+        Computes the rankings of the given users.
+
+        :param users: user IDs
+        :param recommend_fn: batched recommendation function with the signature of `recommend_batch`
+        :param top_n: number of items cached for each user
+        :return: the built cache
+        """
+        user_ids = np.sort(np.asarray([int(u) for u in users], dtype=np.int64))
+        recommendations = recommend_fn(user_ids.tolist(), k=top_n)
+        rankings = np.full((len(user_ids), top_n), -1, dtype=np.int32)
+        for row, user in enumerate(user_ids.tolist()):
+            ranking = [int(i) for i in recommendations[user]]
+            rankings[row, :len(ranking)] = ranking
+        return cls(user_ids, rankings)
+
+    def save(self, cache_dir: str) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        np.save(os.path.join(cache_dir, "user_ids.npy"), self.user_ids)
+        np.save(os.path.join(cache_dir, "rankings.npy"), self.rankings)
+
+    @classmethod
+    def load(cls, cache_dir: str) -> Optional["RecommendationCache"]:
+        try:
+            return cls(np.load(os.path.join(cache_dir, "user_ids.npy"), mmap_mode="r"),
+                       np.load(os.path.join(cache_dir, "rankings.npy"), mmap_mode="r"))
+        except (OSError, ValueError):
+            return None
+
+    def lookup(self, user, k: int, items: Optional[List] = None) -> Optional[List[str]]:
+        """
+        Answers a recommendation request from the cached rankings.
+
+        :param user: user ID
+        :param k: number of items to be returned
+        :param items: optional candidate items. The cached ranking is intersected with them, which
+        gives the exact answer only if at least k candidates appear in the cached top-N
+        :return: ranking (of item IDs), or None if the request cannot be answered from the cache
+        """
+        user = int(user)
+        row = np.searchsorted(self.user_ids, user)
+        if row >= len(self.user_ids) or self.user_ids[row] != user:
+            return None
+        ranking = np.asarray(self.rankings[row])
+        ranking = ranking[ranking >= 0]
+        if items is None:
+            if k > self.top_n:
+                return None
+            return [str(i) for i in ranking[:k].tolist()]
+        candidates = np.unique(np.asarray([int(i) for i in items], dtype=np.int64))
+        hits = ranking[np.isin(ranking, candidates)][:k]
+        if len(hits) < min(k, len(candidates)):
+            # the remaining candidates are ranked below the cached top-N: they have to be scored
+            return None
+        return [str(i) for i in hits.tolist()]
+
+
+_cache: Optional[RecommendationCache] = None
+_cache_key: Optional[str] = None
+_cache_lock = threading.Lock()
+
+
+def get_recommendation_cache(fingerprint: str, users_fn: Callable[[], List[str]],
+                             recommend_fn: Callable[..., Dict[str, List[str]]]) -> RecommendationCache:
+    """
+    Returns the recommendation cache of the given model. The cache is stored in a directory named
+    after the hash of the model file, so it is invalidated automatically as soon as the model
+    changes: a new cache is built and the caches of the previous models are removed.
+
+    :param fingerprint: hash of the pre-trained model file (see `model_fingerprint`)
+    :param users_fn: function returning the IDs of all the users known by the model
+    :param recommend_fn: batched recommendation function with the signature of `recommend_batch`
+    :return: the cache of the current model
+    """
+    global _cache, _cache_key
+    if _cache is not None and _cache_key == fingerprint:
+        return _cache
+    with _cache_lock:
+        if _cache is None or _cache_key != fingerprint:
+            cache_dir = os.path.join(CACHE_DIR, fingerprint)
+            cache = RecommendationCache.load(cache_dir)
+            if cache is None:
+                print(f"\n{get_time()} - Building top-{RECOMMENDATION_CACHE_SIZE} recommendation cache for "
+                      f"model {fingerprint}.\n")
+                built = RecommendationCache.build(users_fn(), recommend_fn)
+                # caches of previous models are never used again
+                if os.path.isdir(CACHE_DIR):
+                    for name in os.listdir(CACHE_DIR):
+                        shutil.rmtree(os.path.join(CACHE_DIR, name), ignore_errors=True)
+                built.save(cache_dir)
+                with open(os.path.join(cache_dir, "meta.json"), "w") as f:
+                    json.dump({"model_sha256": fingerprint, "top_n": built.top_n}, f)
+                cache = RecommendationCache.load(cache_dir) or built
+            _cache, _cache_key = cache, fingerprint
+    return _cache
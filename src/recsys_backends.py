@@ -0,0 +1,167 @@
+import os
+import json
+from typing import List
+import numpy as np
+from src.recommendation_cache import model_fingerprint
+from src.ann_index import IVFInnerProductIndex, ANN_NPROBE
+from src.utils import get_time
+
+# files written by the embedding export step of data/ml-100k/recsys_training.py
+EMBEDDING_FILES = ("user_embeddings", "item_embeddings", "user_tokens", "item_tokens", "history_indptr",
+                   "history_indices")
+
+
+class RecBoleScorer:
+    """
+    Scores users with a pre-trained RecBole model. RecBole and torch are imported only when this
+    backend is created, so that they are not needed by the other backends.
+    """
+
+    def __init__(self, model_path: str) -> None:
+        from recbole.quick_start import load_data_and_model
+        from recbole.utils.case_study import full_sort_scores
+        self._full_sort_scores = full_sort_scores
+        self.config, self.model, self.dataset, self.train_data, self.valid_data, self.test_data = \
+            load_data_and_model(model_file=model_path)
+        self.fingerprint = model_fingerprint(model_path)
+        self.item_tokens = np.asarray(self.dataset.field2id_token[self.dataset.iid_field])
+
+    def user_tokens(self) -> List[str]:
+        return self.dataset.id2token(self.dataset.uid_field, list(range(1, self.dataset.user_num))).tolist()
+
+    def user_index(self, users: List) -> np.ndarray:
+        return np.asarray(self.dataset.token2id(self.dataset.uid_field, [str(u) for u in users]))
+
+    def item_index(self, items: List) -> np.ndarray:
+        return np.asarray(self.dataset.token2id(self.dataset.iid_field, [str(i) for i in items]))
+
+    def scores(self, user_index: np.ndarray) -> np.ndarray:
+        """
+        :param user_index: internal indices of the users
+        :return: score matrix (users x items), where interacted items and padding are set to -inf
+        """
+        return self._full_sort_scores(user_index, self.model, self.test_data,
+                                      device=self.config['device']).cpu().numpy()
+
+
+class NumpyScorer:
+    """
+    Scores users with the user and item embeddings exported from a pre-trained BPR model. A score is
+    the dot product between the user and the item embeddings, as in the `full_sort_predict` of BPR,
+    so the rankings are the same as the ones of the RecBole backend without loading RecBole, torch,
+    and the dataset splits.
+    """
+
+    def __init__(self, embeddings_dir: str) -> None:
+        arrays = {name: np.load(os.path.join(embeddings_dir, f"{name}.npy"), mmap_mode="r")
+                  for name in EMBEDDING_FILES}
+        self.user_embeddings = np.ascontiguousarray(arrays["user_embeddings"], dtype=np.float32)
+        self.item_embeddings = np.ascontiguousarray(arrays["item_embeddings"], dtype=np.float32)
+        self.item_tokens = np.asarray(arrays["item_tokens"])
+        self._user_tokens = np.asarray(arrays["user_tokens"])
+        self.history_indptr = np.asarray(arrays["history_indptr"])
+        self.history_indices = np.asarray(arrays["history_indices"])
+        self._user_ids = {token: i for i, token in enumerate(self._user_tokens.tolist())}
+        self._item_ids = {token: i for i, token in enumerate(self.item_tokens.tolist())}
+        self.fingerprint = exported_model_fingerprint(embeddings_dir)
+        self.embeddings_dir = embeddings_dir
+        self._ann_index = None
+
+    def user_tokens(self) -> List[str]:
+        # index 0 is the padding token
+        return self._user_tokens[1:].tolist()
+
+    @staticmethod
+    def _index(mapping: dict, tokens: List, kind: str) -> np.ndarray:
+        try:
+            return np.asarray([mapping[str(t)] for t in tokens], dtype=np.int64)
+        except KeyError as e:
+            raise ValueError(f"The {kind} {e.args[0]} is not known by the recommendation model.")
+
+    def user_index(self, users: List) -> np.ndarray:
+        return self._index(self._user_ids, users, "user")
+
+    def item_index(self, items: List) -> np.ndarray:
+        return self._index(self._item_ids, items, "item")
+
+    def scores(self, user_index: np.ndarray) -> np.ndarray:
+        """
+        :param user_index: internal indices of the users
+        :return: score matrix (users x items), where interacted items and padding are set to -inf
+        """
+        scores = self.user_embeddings[user_index] @ self.item_embeddings.T
+        starts, ends = self.history_indptr[user_index], self.history_indptr[user_index + 1]
+        lengths = ends - starts
+        rows = np.repeat(np.arange(len(user_index)), lengths)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        scores[rows, self.history_indices[offsets]] = -np.inf
+        scores[:, 0] = -np.inf
+        return scores
+
+    @property
+    def ann_index(self) -> IVFInnerProductIndex:
+        """
+        Approximate nearest neighbour index over the item embeddings. It is built the first time it is
+        needed and saved next to the embeddings.
+        """
+        if self._ann_index is None:
+            index_dir = os.path.join(self.embeddings_dir, "ann")
+            index = IVFInnerProductIndex.load(index_dir, self.fingerprint)
+            if index is None:
+                print(f"\n{get_time()} - Building ANN index over {len(self.item_embeddings) - 1} items.\n")
+                index = IVFInnerProductIndex.build(self.item_embeddings)
+                index.save(index_dir, self.fingerprint)
+            self._ann_index = index
+        return self._ann_index
+
+    def approximate_top_k(self, user_index: np.ndarray, k: int, nprobe: int = ANN_NPROBE) -> np.ndarray:
+        """
+        Approximate full-catalog top-k through the ANN index, which scores only the items of the
+        `nprobe` inverted lists closest to each user instead of the entire catalog.
+
+        :param user_index: internal indices of the users
+        :param k: number of items to be returned for each user
+        :param nprobe: number of inverted lists scanned for each user (recall-vs-latency knob)
+        :return: matrix (users x k) of internal item indices, padded with -1
+        """
+        history = [self.history_indices[self.history_indptr[u]:self.history_indptr[u + 1]] for u in user_index]
+        return self.ann_index.search(self.user_embeddings[user_index], k, nprobe=nprobe, exclude=history)
+
+
+def exported_model_fingerprint(embeddings_dir: str) -> str:
+    """
+    Returns the hash of the model the embeddings have been exported from.
+
+    :param embeddings_dir: directory containing the exported embeddings
+    :return: hex digest of the model file
+    """
+    with open(os.path.join(embeddings_dir, "meta.json"), "r") as f:
+        return json.load(f)["model_sha256"]
+
+
+def load_scorer(backend: str):
+    """
+    Creates the scorer of the given backend.
+
+    :param backend: "recbole" to score with the RecBole model at RECSYS_MODEL_PATH or "numpy" to score
+    with the embeddings exported to RECSYS_EMBEDDINGS_DIR
+    :return: the scorer
+    """
+    if backend == "numpy":
+        return NumpyScorer(os.getenv("RECSYS_EMBEDDINGS_DIR"))
+    if backend == "recbole":
+        return RecBoleScorer(os.getenv("RECSYS_MODEL_PATH"))
+    raise ValueError(f"Unknown recommendation backend: {backend}")
+
+
+def current_fingerprint(backend: str) -> str:
+    """
+    Returns the hash of the model currently configured for the given backend. It is cheap to call, as
+    the hash of the model file is recomputed only when the file changes.
+
+    :param backend: "recbole" or "numpy"
+    :return: hex digest of the model file
+    """
+    if backend == "numpy":
+        return exported_model_fingerprint(os.getenv("RECSYS_EMBEDDINGS_DIR"))
+    return model_fingerprint(os.getenv("RECSYS_MODEL_PATH"))
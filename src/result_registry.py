@@ -0,0 +1,168 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+import numpy as np
+from src.utils import get_time
+
+# prefix of the handles returned to the LLM, used to tell them apart from lists and file paths
+HANDLE_PREFIX = "result_set:"
+# maximum number of result sets kept in memory
+RESULT_SET_MAX_ENTRIES = int(os.getenv("RESULT_SET_MAX_ENTRIES", 1024))
+# maximum total size (in bytes) of the result sets kept in memory
+RESULT_SET_MAX_BYTES = int(os.getenv("RESULT_SET_MAX_BYTES", 64 * 1024 * 1024))
+# seconds after which an unused result set expires
+RESULT_SET_TTL = float(os.getenv("RESULT_SET_TTL", 3600))
+# optional directory where the result sets are also written, so that they can be resolved by the other
+# processes of a multi-process deployment. When not set, the result sets never touch the filesystem
+RESULT_SET_SPILL_DIR = os.getenv("RESULT_SET_SPILL_DIR")
+
+
+class ResultSetRegistry:
+    """
+    In-process registry of the item lists exchanged between tools (e.g., the output of the item
+    filter tool passed to the recommendation tool). Every list is stored as a NumPy array under an
+    opaque handle, which is what the LLM passes from one tool call to the next.
+
+    Handles are derived from the content of the list, so registering the same list twice returns
+    the same handle. Entries are evicted in least-recently-used order when the number of entries or
+    their total size exceeds the cap, and they expire when they are not used for longer than the TTL.
+    """
+
+    def __init__(self, max_entries: int = RESULT_SET_MAX_ENTRIES, max_bytes: int = RESULT_SET_MAX_BYTES,
+                 ttl: float = RESULT_SET_TTL, spill_dir: Optional[str] = RESULT_SET_SPILL_DIR) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        # handle -> (array, last access time), from the least to the most recently used
+        self._entries = OrderedDict()
+        self._n_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_handle(value) -> bool:
+        return isinstance(value, str) and value.startswith(HANDLE_PREFIX)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _spill_path(self, handle: str) -> str:
+        return os.path.join(self.spill_dir, f"{handle[len(HANDLE_PREFIX):]}.npy")
+
+    def _insert(self, handle: str, items: np.ndarray) -> None:
+        # the lock must be held by the caller
+        if handle in self._entries:
+            self._entries.move_to_end(handle)
+            self._entries[handle] = (self._entries[handle][0], time.monotonic())
+            return
+        self._entries[handle] = (items, time.monotonic())
+        self._n_bytes += items.nbytes
+        self._evict()
+
+    def _remove(self, handle: str) -> None:
+        items, _ = self._entries.pop(handle)
+        self._n_bytes -= items.nbytes
+
+    def _evict(self) -> None:
+        # expired entries first, then the least recently used ones until the caps are respected. The most
+        # recent entry is always kept, so the handle just returned can be resolved
+        deadline = time.monotonic() - self.ttl
+        for handle in [h for h, (_, accessed) in self._entries.items() if accessed < deadline]:
+            self._remove(handle)
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._n_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def put(self, items: Iterable) -> str:
+        """
+        Registers a list of item IDs.
+
+        :param items: item IDs
+        :return: handle of the registered list
+        """
+        items = np.asarray([int(i) for i in items] if not isinstance(items, np.ndarray) else items,
+                           dtype=np.int64)
+        handle = HANDLE_PREFIX + hashlib.md5(items.tobytes()).hexdigest()
+        with self._lock:
+            self._insert(handle, items)
+        if self.spill_dir is not None:
+            path = self._spill_path(handle)
+            if os.path.exists(path):
+                # the expiration of the spilled file restarts, as for the in-memory entry
+                os.utime(path)
+            else:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                # written to a temporary file first, so other processes never read a partial file
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, items)
+                os.replace(tmp_path, path)
+        return handle
+
+    def get(self, handle: str) -> np.ndarray:
+        """
+        Returns the list of item IDs registered under the given handle.
+
+        :param handle: handle returned by `put`
+        :return: array of item IDs
+        :raises KeyError: if the handle is unknown or expired
+        """
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None and entry[1] >= time.monotonic() - self.ttl:
+                self._entries.move_to_end(handle)
+                self._entries[handle] = (entry[0], time.monotonic())
+                return entry[0]
+            if entry is not None:
+                self._remove(handle)
+        if self.spill_dir is not None:
+            # the list may have been registered by another process
+            path = self._spill_path(handle)
+            if os.path.exists(path) and time.time() - os.path.getmtime(path) < self.ttl:
+                items = np.load(path)
+                with self._lock:
+                    self._insert(handle, items)
+                return items
+        raise KeyError(f"Unknown or expired result set: {handle}")
+
+    def purge_spilled(self) -> int:
+        """
+        Deletes the spilled result sets older than the TTL.
+
+        :return: number of deleted files
+        """
+        if self.spill_dir is None or not os.path.isdir(self.spill_dir):
+            return 0
+        deleted = 0
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            try:
+                if time.time() - os.path.getmtime(path) >= self.ttl:
+                    os.remove(path)
+                    deleted += 1
+            except OSError:
+                continue
+        if deleted:
+            print(f"\n{get_time()} - Deleted {deleted} expired result sets from {self.spill_dir}.\n")
+        return deleted
+
+
+_registry: Optional[ResultSetRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_result_registry() -> ResultSetRegistry:
+    """
+    Returns the process-wide result set registry.
+
+    :return: the shared registry
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ResultSetRegistry()
+                _registry.purge_spilled()
+    return _registry
@@ -0,0 +1,111 @@
+import os
+import time
+import asyncio
+from typing import Optional
+import aiosqlite
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from src.utils import get_time
+
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.db")
+# seconds of inactivity after which the conversation thread of a chat session is deleted
+SESSION_TTL = float(os.getenv("SESSION_TTL", 3600))
+# seconds between two evictions of idle threads
+EVICTION_INTERVAL = float(os.getenv("EVICTION_INTERVAL", 300))
+
+
+class SessionStore:
+    """
+    Disk-backed storage of the LangGraph conversation threads, one per chat session.
+
+    The checkpoints are saved in a SQLite database instead of memory, and the last activity of every
+    thread is recorded in the same database. Threads that have been idle for longer than the TTL are
+    periodically deleted, so the storage stays bounded with many concurrent chats.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_DB, ttl: float = SESSION_TTL,
+                 eviction_interval: float = EVICTION_INTERVAL) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.eviction_interval = eviction_interval
+        self.checkpointer: Optional[AsyncSqliteSaver] = None
+        self._conn: Optional[aiosqlite.Connection] = None
+        # separate connection for the activity table, so its commits never interleave with the checkpointer ones
+        self._activity_conn: Optional[aiosqlite.Connection] = None
+        self._eviction_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def setup(self) -> AsyncSqliteSaver:
+        """
+        Opens the database and starts the periodic eviction of idle threads. It must be called from
+        the event loop of the application; calling it again has no effect.
+
+        :return: the checkpointer to be used to compile the graph
+        """
+        async with self._lock:
+            if self.checkpointer is None:
+                self._conn = await aiosqlite.connect(self.path)
+                await self._conn.execute("PRAGMA journal_mode=WAL")
+                self._activity_conn = await aiosqlite.connect(self.path)
+                await self._activity_conn.execute(
+                    "CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, last_seen REAL)"
+                )
+                await self._activity_conn.commit()
+                self.checkpointer = AsyncSqliteSaver(self._conn)
+                await self.checkpointer.setup()
+                self._eviction_task = asyncio.create_task(self._eviction_loop())
+        return self.checkpointer
+
+    async def touch(self, thread_id: str) -> None:
+        """
+        Records activity on the given thread.
+
+        :param thread_id: LangGraph thread ID of the chat session
+        """
+        await self._activity_conn.execute(
+            "INSERT INTO thread_activity (thread_id, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_seen = excluded.last_seen",
+            (thread_id, time.time())
+        )
+        await self._activity_conn.commit()
+
+    async def delete(self, thread_id: str) -> None:
+        """
+        Deletes the checkpoints of the given thread.
+
+        :param thread_id: LangGraph thread ID of the chat session
+        """
+        await self.checkpointer.adelete_thread(thread_id)
+        await self._activity_conn.execute("DELETE FROM thread_activity WHERE thread_id = ?", (thread_id,))
+        await self._activity_conn.commit()
+
+    async def evict_idle(self) -> int:
+        """
+        Deletes the threads that have been idle for longer than the TTL.
+
+        :return: number of deleted threads
+        """
+        async with self._activity_conn.execute(
+            "SELECT thread_id FROM thread_activity WHERE last_seen < ?", (time.time() - self.ttl,)
+        ) as cursor:
+            expired = [row[0] for row in await cursor.fetchall()]
+        for thread_id in expired:
+            await self.delete(thread_id)
+        if expired:
+            print(f"\n{get_time()} - Evicted {len(expired)} idle conversation threads.\n")
+        return len(expired)
+
+    async def _eviction_loop(self) -> None:
+        while True:
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                print(f"\n{get_time()} - Eviction of idle threads failed due to: {e}\n")
+            await asyncio.sleep(self.eviction_interval)
+
+    async def close(self) -> None:
+        if self._eviction_task is not None:
+            self._eviction_task.cancel()
+        for conn in (self._conn, self._activity_conn):
+            if conn is not None:
+                await conn.close()
+        self.checkpointer, self._conn, self._activity_conn, self._eviction_task = None, None, None, None
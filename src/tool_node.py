@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional
+from langchain_core.messages import ToolMessage
+from src.utils import get_time
+
+# maximum number of blocking tool calls executed at the same time by the worker threads
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", 8))
+# default time (in seconds) a tool call is allowed to run before it is reported as failed
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", 60))
+
+
+class AsyncToolNode:
+    """
+    A node that runs the tools requested in the last AIMessage.
+
+    The independent tool calls of the same message are executed concurrently. Tools with a native
+    async implementation are awaited directly, while the blocking ones (e.g., model scoring, SQL
+    queries) are offloaded to a bounded pool of worker threads, so they never block the event loop
+    that serves the other chat sessions. Every call is bounded by a timeout, which can be customized
+    for each tool.
+
+    A timeout only reports the call as failed: Python threads cannot be interrupted, so a call that
+    is already running keeps its worker thread until it returns. A few hung calls (e.g., the first
+    load of the model) can therefore occupy all the `max_workers` threads, and the calls queued
+    behind them time out without having started. Calls that time out before starting are cancelled.
+    """
+
+    def __init__(self, tools: list, max_workers: int = TOOL_MAX_WORKERS, timeout: float = TOOL_TIMEOUT,
+                 timeouts: Optional[Dict[str, float]] = None) -> None:
+        self.tools_by_name = {tool.name: tool for tool in tools}
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    @staticmethod
+    def _last_message(inputs: dict):
+        if messages := inputs.get("messages", []):
+            return messages[-1]
+        raise ValueError("No message found in input")
+
+    def _timeout_of(self, name: str) -> float:
+        return self.timeouts.get(name, self.timeout)
+
+    def _timeout_result(self, name: str) -> str:
+        print(f"\n{get_time()} - {name} timed out after {self._timeout_of(name)} seconds.\n")
+        return json.dumps({
+            "status": "failure",
+            "message": f"The tool {name} did not answer within {self._timeout_of(name)} seconds.",
+        })
+
+    @staticmethod
+    def _tool_message(tool_call: dict, tool_result) -> ToolMessage:
+        return ToolMessage(
+            content=json.dumps(tool_result),
+            name=tool_call["name"],
+            tool_call_id=tool_call["id"],
+        )
+
+    async def _arun(self, tool_call: dict):
+        tool = self.tools_by_name[tool_call["name"]]
+        if getattr(tool, "coroutine", None) is not None:
+            call = tool.ainvoke(tool_call["args"])
+        else:
+            loop = asyncio.get_running_loop()
+            call = loop.run_in_executor(self._executor, tool.invoke, tool_call["args"])
+        try:
+            return await asyncio.wait_for(call, timeout=self._timeout_of(tool_call["name"]))
+        except asyncio.TimeoutError:
+            return self._timeout_result(tool_call["name"])
+
+    async def ainvoke(self, inputs: dict) -> dict:
+        """
+        Runs the requested tool calls concurrently. Used by the asynchronous graph execution (e.g.,
+        `graph.astream` in the Chainlit app).
+        """
+        message = self._last_message(inputs)
+        results = await asyncio.gather(*(self._arun(tool_call) for tool_call in message.tool_calls))
+        return {"messages": [self._tool_message(tool_call, result)
+                             for tool_call, result in zip(message.tool_calls, results)]}
+
+    def invoke(self, inputs: dict) -> dict:
+        """
+        Runs the requested tool calls concurrently on the worker threads. Used by the synchronous graph
+        execution (e.g., `graph.stream` in the command line app).
+        """
+        message = self._last_message(inputs)
+        start = time.monotonic()
+        futures = [self._executor.submit(self.tools_by_name[tool_call["name"]].invoke, tool_call["args"])
+                   for tool_call in message.tool_calls]
+        outputs = []
+        for tool_call, future in zip(message.tool_calls, futures):
+            # all the calls started together, so each deadline is relative to the submission time
+            remaining = max(0.0, start + self._timeout_of(tool_call["name"]) - time.monotonic())
+            try:
+                result = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                # a call still waiting for a worker is dropped; a running one cannot be stopped
+                future.cancel()
+                result = self._timeout_result(tool_call["name"])
+            outputs.append(self._tool_message(tool_call, result))
+        return {"messages": outputs}
+
+    def __call__(self, inputs: dict) -> dict:
+        return self.invoke(inputs)
+
+    def shutdown(self) -> None:
+        """
+        Stops the worker threads without waiting for the running tool calls, which may be hung, and
+        cancels the queued ones.
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
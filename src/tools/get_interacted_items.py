@@ -6,6 +6,9 @@ from src.tools.utils import execute_sql_query, define_sql_query
 from src.constants import JSON_GENERATION_ERROR
 from src.utils import get_time
 
+# maximum number of items returned by get_interacted_items_tool
+MAX_INTERACTED_ITEMS = 20
+
 
 class GetInteractedItemsInput(BaseModel):
     """Schema for retrieving items a user has interacted with."""
@@ -22,23 +25,23 @@ def get_interacted_items_tool(user: int) -> str:
     if user is None:
         return json.dumps(JSON_GENERATION_ERROR)
 
-    # Define SQL query to get interacted items for user
-    sql_query, _, _ = define_sql_query("interactions", {"user": user})
-    result = execute_sql_query(sql_query)
+    # Define SQL query to get the most recent interacted items for user. One more item than the limit is
+    # requested to know whether the user has interacted with more items
+    sql_query, params, _, _ = define_sql_query("interactions", {"user": user, "limit": MAX_INTERACTED_ITEMS + 1})
+    result = execute_sql_query(sql_query, params)
 
-    if not result or not result[0] or not result[0][0]:
+    if not result:
         return json.dumps({
             "status": "failure",
             "message": f"No interaction information found for user {user}.",
         })
 
-    # Extract interacted item IDs from query result
-    interacted_items = result[0][0].split(",")
+    # Extract interacted item IDs from query result, from the oldest to the most recent
+    interacted_items = [str(row[0]) for row in reversed(result[:MAX_INTERACTED_ITEMS])]
 
-    # Limit to most recent 20 if more than 20 interactions
-    if len(interacted_items) > 20:
-        interacted_items = interacted_items[-20:]
-        message = f"User {user} has interacted with more than 20 items. The most recent 20 are returned."
+    if len(result) > MAX_INTERACTED_ITEMS:
+        message = (f"User {user} has interacted with more than {MAX_INTERACTED_ITEMS} items. "
+                   f"The most recent {MAX_INTERACTED_ITEMS} are returned.")
     else:
         message = f"All items user {user} interacted with are returned."
 
@@ -63,11 +66,11 @@ def get_interacted_items_list(input: GetInteractedItemsInput) -> Union[List[int]
         return None
 
     # Define SQL query to get interacted items for user
-    sql_query, _, _ = define_sql_query("interactions", {"user": user})
-    result = execute_sql_query(sql_query)
+    sql_query, params, _, _ = define_sql_query("interactions", {"user": user})
+    result = execute_sql_query(sql_query, params)
 
-    # Extract interacted item IDs from query result
+    # Extract interacted item IDs from query result, from the oldest to the most recent
     if result:
-        return result[0][0].split(",")
+        return [str(row[0]) for row in reversed(result)]
     else:
         return None
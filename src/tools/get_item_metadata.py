@@ -2,7 +2,8 @@ import json
 from typing import List, Union, Dict, Literal
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool
-from src.tools.utils import execute_sql_query, define_sql_query, convert_to_list
+from src.tools.utils import convert_to_list
+from src.item_catalog import get_item_catalog
 from src.constants import JSON_GENERATION_ERROR
 from src.utils import get_time
 
@@ -18,7 +19,7 @@ class GetItemMetadataInput(BaseModel):
         ...,
         description=(
             "Item ID(s) for which the metadata has to be retrieved, either as a list of integers "
-            "or as a path to a JSON file containing the item IDs."
+            "or as the handle of a result set containing the item IDs."
         )
     )
     get: List[AllowedFeatures] = Field(
@@ -40,26 +41,22 @@ def get_item_metadata_tool(items: Union[List[int], str], get: List[AllowedFeatur
     if items is None or get is None:
         return json.dumps(JSON_GENERATION_ERROR)
 
-    specification = ["item_id"] + get
-
     try:
         items = convert_to_list(items)
     except Exception:
         return json.dumps({
             "status": "failure",
-            "message": "There are issues with the temporary file containing the item IDs.",
+            "message": "There are issues with the result set containing the item IDs.",
         })
 
-    sql_query, _, _ = define_sql_query("items", {"items": items, "specification": specification})
-    result = execute_sql_query(sql_query)
+    result = get_item_catalog().get_metadata(items, get)
 
     if result:
         return_dict = {}
-        for j in range(len(result)):
-            return_dict[result[j][0]] = {}
-            for i, spec in enumerate(specification):
-                if spec != "item_id":
-                    return_dict[result[j][0]][spec] = result[j][i] if result[j][i] is not None else 'unknown'
+        for item_id, metadata in result.items():
+            return_dict[item_id] = {}
+            for spec in get:
+                return_dict[item_id][spec] = metadata[spec] if metadata[spec] is not None else 'unknown'
 
         print(f"\n{get_time()} - Returned dictionary: {return_dict}\n")
 
@@ -90,16 +87,14 @@ def get_item_metadata_dict(input: GetItemMetadataInput) -> Union[Dict[int, Dict[
         return None
 
     specification = input['get']
-    sql_query, _, _ = define_sql_query("items", {"items": items, "specification": specification})
-    result = execute_sql_query(sql_query)
+    result = get_item_catalog().get_metadata(items, specification)
 
     if result:
         r_dict = {}
-        for j in range(len(result)):
-            item_id = result[j][0]
+        for item_id, metadata in result.items():
             r_dict[item_id] = {}
-            for i, spec in enumerate(specification):
-                r_dict[item_id][spec] = result[j][i] if result[j][i] is not None else "unknown"
+            for spec in specification:
+                r_dict[item_id][spec] = metadata[spec] if metadata[spec] is not None else "unknown"
         return r_dict
     else:
         return None
\ No newline at end of file
@@ -5,13 +5,14 @@ from langchain.tools import tool
 
 from src.constants import JSON_GENERATION_ERROR
 from src.tools.utils import convert_to_list
-from src.utils import get_time, read_ml100k_ratings
+from src.utils import get_time
+from src.interaction_index import get_interaction_index
 
 
 class GetLikePercentageInput(BaseModel):
     items: Union[List[int], str] = Field(
         ...,
-        description="A list of item IDs or a path to a JSON file containing them."
+        description="A list of item IDs or the handle of a result set containing them."
     )
 
 
@@ -30,15 +31,15 @@ def get_like_percentage_tool(items: Union[List[int], str]) -> str:
     except Exception:
         return json.dumps({
             "status": "failure",
-            "message": "There are issues with the temporary file containing the item IDs.",
+            "message": "There are issues with the result set containing the item IDs.",
         })
 
 
     items = [int(i) for i in items]
-    # Load rating file
-    user_interactions = read_ml100k_ratings()
-    n_users = len(set(int(inter[0]) for inter in user_interactions))
-    n_users_by_items = len(set(int(inter[0]) for inter in user_interactions if inter[1] in items))
+    # the interaction index is built once and memory-mapped from disk
+    index = get_interaction_index()
+    n_users = index.n_users
+    n_users_by_items = index.count_users(items)
     perc = n_users_by_items / n_users * 100
 
     print(f"\n{get_time()} - Returned percentage: {perc:.2f}%\n")
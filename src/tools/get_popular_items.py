@@ -1,7 +1,7 @@
 from langchain.tools import tool
 import json
-import numpy as np
-from src.tools.utils import execute_sql_query, define_sql_query, convert_to_list
+from src.tools.utils import convert_to_list
+from src.popularity_index import get_popularity_index
 from src.constants import JSON_GENERATION_ERROR
 from src.utils import get_time
 
@@ -23,8 +23,8 @@ class GetPopularItemsInput(BaseModel):
     )
     items: Optional[Union[List[int], str]] = Field(
         default=None,
-        description="Item ID(s) for which the popularity has to be computed, either directly as a list or as a "
-                    "path to a JSON file."
+        description="Item ID(s) for which the popularity has to be computed, either directly as a list or as "
+                    "the handle of a result set returned by another tool."
     )
     user_group: Optional[List[AllowedGroups]] = Field(
         default=None,
@@ -46,60 +46,34 @@ def get_popular_items_tool(popularity: AllowedPopularity, k: int = 20, items: Op
     if popularity is None or k is None:
         return json.dumps(JSON_GENERATION_ERROR)
 
-    # SQL query building
+    # user groups whose rating counts are summed to compute the popularity (None for all the ratings)
     if popularity == "standard":
-        if items is not None and items:
-            try:
-                items = convert_to_list(items)
-            except Exception:
-                return json.dumps({
-                    "status": "failure",
-                    "message": "There are issues with the temporary file containing the "
-                               "item IDs.",
-                })
-            items = [int(i) for i in items]
-            sql_query, _, _ = define_sql_query("items", {"select": ["item_id", "n_ratings"], "items": items})
-        else:
-            sql_query, _, _ = define_sql_query("items", {"select": ["item_id", "n_ratings"]})
+        groups = None
     else:
         if user_group is not None and not user_group:
             return json.dumps(JSON_GENERATION_ERROR)
-        user_group_cols = [f"n_ratings_{group}" for group in user_group]
-        if items:
-            try:
-                items = convert_to_list(items)
-            except Exception:
-                return json.dumps({
-                    "status": "failure",
-                    "message": "There are issues with the temporary file containing the "
-                               "item IDs.",
-                })
-            items = [int(i) for i in items]
-            sql_query, _, _ = define_sql_query("items", {"select": ["item_id"] + user_group_cols, "items": items})
-        else:
-            sql_query, _, _ = define_sql_query("items", {"select": ["item_id"] + user_group_cols})
+        groups = list(user_group)
 
-    # Execute and process result
-    if sql_query:
-        result = execute_sql_query(sql_query)
-        ids_with_count = [(str(row[0]), sum(row[1:])) for row in result]
-        ids_with_count_sorted = sorted(ids_with_count, key=lambda x: x[1], reverse=True)
-
-        q75 = np.quantile([count for _, count in ids_with_count_sorted], 0.75)
-        item_ids = [item_id for item_id, count in ids_with_count_sorted if count > q75]
+    if items is not None and items:
+        try:
+            items = convert_to_list(items)
+        except Exception:
+            return json.dumps({
+                "status": "failure",
+                "message": "There are issues with the result set containing the "
+                           "item IDs.",
+            })
+        items = [int(i) for i in items]
+    else:
+        items = None
 
-        if len(item_ids) > k:
-            item_ids = item_ids[:k]
+    # the rankings of all the combinations of user groups are precomputed
+    item_ids = get_popularity_index().top_k(groups, k, items=items)
 
-        print(f"\n{get_time()} - Returned list: {item_ids}\n")
+    print(f"\n{get_time()} - Returned list: {item_ids}\n")
 
-        return json.dumps({
-            "status": "success",
-            "message": f"The IDs of the {len(item_ids)} most popular items are returned.",
-            "data": item_ids
-        })
-    else:
-        return json.dumps({
-            "status": "failure",
-            "message": "The SQL query did not produce any result"
-        })
\ No newline at end of file
+    return json.dumps({
+        "status": "success",
+        "message": f"The IDs of the {len(item_ids)} most popular items are returned.",
+        "data": item_ids
+    })
@@ -0,0 +1,75 @@
+import json
+from typing import List, Literal, Optional, Union
+from pydantic import BaseModel, Field
+from langchain_core.tools import tool
+from src.tools.utils import convert_to_list
+from src.item_neighbours import similar_items
+from src.constants import JSON_GENERATION_ERROR
+from src.utils import get_time
+
+AllowedSimilarity = Literal["storyline", "collaborative"]
+# neighbour table answering each kind of similarity
+NEIGHBOUR_SOURCE = {"storyline": "storyline", "collaborative": "bpr"}
+
+
+class GetSimilarItemsInput(BaseModel):
+    item: int = Field(..., description="ID of the item for which similar items have to be found.")
+    k: int = Field(default=10, description="Number of similar items to be returned.")
+    similarity: AllowedSimilarity = Field(
+        default="storyline",
+        description="'storyline' for items with a similar storyline/description, 'collaborative' for items liked "
+                    "by the same users."
+    )
+    items: Optional[Union[List[int], str]] = Field(
+        default=None,
+        description="Item IDs (list) or the handle of a result set containing the item IDs. When given, the similar "
+                    "items are restricted to these items."
+    )
+
+
+@tool(args_schema=GetSimilarItemsInput)
+def get_similar_items_tool(item: int, k: int = 10, similarity: AllowedSimilarity = "storyline",
+                           items: Optional[Union[List[int], str]] = None) -> str:
+    """
+    Returns the IDs of the k items most similar to the given item, either by storyline or by the users who liked them.
+    """
+    print(f"\n{get_time()} - get_similar_items_tool has been triggered!!!\n")
+
+    if item is None or k is None:
+        return json.dumps(JSON_GENERATION_ERROR)
+
+    if items is not None and items:
+        try:
+            items = convert_to_list(items)
+        except Exception:
+            return json.dumps({
+                "status": "failure",
+                "message": "There are issues with the result set containing the item IDs."
+            })
+        items = [int(i) for i in items]
+    else:
+        items = None
+
+    try:
+        similar = similar_items(NEIGHBOUR_SOURCE[similarity], int(item), int(k), items=items)
+    except Exception as e:
+        return json.dumps({
+            "status": "failure",
+            "message": f"Similar items computation failed due to: {str(e)}"
+        })
+
+    if similar is None:
+        return json.dumps({
+            "status": "failure",
+            "message": f"No information found for the given item: {item}."
+        })
+
+    item_ids = [str(i) for i, _ in similar]
+
+    print(f"\n{get_time()} - Returned list: {item_ids}\n")
+
+    return json.dumps({
+        "status": "success",
+        "message": f"The IDs of the {len(item_ids)} items most similar to item {item} are returned.",
+        "data": item_ids
+    })
@@ -1,13 +1,27 @@
 import json
-import torch
+import numpy as np
 from src.tools.utils import get_time, convert_to_list
-from recbole.quick_start import load_data_and_model
-from recbole.utils.case_study import full_sort_scores, full_sort_topk
 from langchain_core.tools import tool
 from src.constants import JSON_GENERATION_ERROR
+from src.recommendation_cache import get_recommendation_cache
+from src.recsys_backends import load_scorer, current_fingerprint
 from pydantic import BaseModel, Field
 from typing import List, Union, Optional
 import os
+import functools
+import threading
+
+# number of users scored together in a single forward pass by the batched recommendation API
+RECOMMENDATION_BATCH_SIZE = 256
+# "recbole" scores with the RecBole model at RECSYS_MODEL_PATH, "numpy" with the embeddings exported
+# to RECSYS_EMBEDDINGS_DIR by data/ml-100k/recsys_training.py
+RECSYS_BACKEND = os.getenv("RECSYS_BACKEND", "recbole")
+# full-catalog rankings are computed through the approximate nearest neighbour index of the item
+# embeddings (numpy backend only)
+RECSYS_USE_ANN = os.getenv("RECSYS_USE_ANN") == "true"
+
+# tool calls may run concurrently on several threads: the model has to be loaded only once
+_environment_lock = threading.Lock()
 
 
 class TopKRecommendationInput(BaseModel):
@@ -15,27 +29,56 @@ class TopKRecommendationInput(BaseModel):
     k: int = Field(default=5, description="Number of recommended items.")
     items: Optional[Union[List[int], str]] = Field(
         default=None,
-        description="Item IDs (list) or path to a JSON file containing the item IDs."
+        description="Item IDs (list) or the handle of a result set containing the item IDs."
     )
 
 
-def create_recbole_environment(model_path):
+class BatchTopKRecommendationInput(BaseModel):
+    users: List[int] = Field(..., description="User IDs.")
+    k: int = Field(default=5, description="Number of recommended items for each user.")
+    items: Optional[Union[List[int], str]] = Field(
+        default=None,
+        description="Item IDs (list) or the handle of a result set containing the item IDs. When given, the "
+                    "recommendations of all the users are restricted to these items."
+    )
+
+
+def create_recsys_environment(backend=RECSYS_BACKEND):
     """
-    This function creates a global RecBole environment that can be accessed by the functions that
-    process recommendation requests.
+    This function creates a global scorer that can be accessed by the functions that process
+    recommendation requests.
 
-    :param model_path: path to pre-trained recsys model
+    :param backend: recommendation backend, "recbole" or "numpy"
     """
-    global config, model, dataset, train_data, valid_data, test_data
-    config, model, dataset, train_data, valid_data, test_data = load_data_and_model(
-        model_file=model_path
-    )
+    global scorer
+    scorer = load_scorer(backend)
+
+
+def ensure_recsys_environment():
+    """
+    It creates the global scorer if it has not been created yet, or if the model has changed since it
+    was loaded.
+    """
+    if 'scorer' not in globals() or scorer.fingerprint != current_fingerprint(RECSYS_BACKEND):
+        with _environment_lock:
+            if 'scorer' not in globals() or scorer.fingerprint != current_fingerprint(RECSYS_BACKEND):
+                create_recsys_environment()
+
+
+def get_all_users():
+    """
+    Returns the IDs of all the users known by the loaded model.
+
+    :return: list of user IDs
+    """
+    return scorer.user_tokens()
+
 
 @tool(args_schema=TopKRecommendationInput)
 def get_top_k_recommendations_tool(user: int, k: int = 5, items: Optional[Union[List[int], str]] = None) -> str:
     """
     Returns a list of the IDs of the top k recommended items for the given user.
-    It computes recommendations over the entire item catalog unless a list of items or a path to a temporary file
+    It computes recommendations over the entire item catalog unless a list of items or the handle of a result set
     containing a list of item is given.
     """
     print(f"\n{get_time()} - get_top_k_recommendations has been triggered!!!\n")
@@ -43,22 +86,29 @@ def get_top_k_recommendations_tool(user: int, k: int = 5, items: Optional[Union[
     if user is None or k is None:
         return json.dumps(JSON_GENERATION_ERROR)
 
-    if 'config' not in globals():
-        create_recbole_environment(os.getenv("RECSYS_MODEL_PATH"))
-
-    uid_series = dataset.token2id(dataset.uid_field, [str(user)])
+    ensure_recsys_environment()
 
+    item_list = None
     if items is not None:
         try:
             item_list = convert_to_list(items)
         except Exception:
             return json.dumps({
                 "status": "failure",
-                "message": "There are issues with the temporary file containing the item IDs.",
+                "message": "There are issues with the result set containing the item IDs.",
             })
-        recommended_items = recommend_given_items(uid_series, item_list, k=k)
-    else:
-        recommended_items = recommend_full_catalog(uid_series, k=k)
+
+    # the precomputed rankings answer most requests, the model is used only on a cache miss
+    # the cache is always built with exact rankings, so its answers do not depend on the ANN settings
+    cache = get_recommendation_cache(scorer.fingerprint, get_all_users,
+                                     functools.partial(recommend_batch, exact=True))
+    recommended_items = cache.lookup(user, k, items=item_list)
+
+    if recommended_items is None:
+        if item_list is not None:
+            recommended_items = recommend_given_items(user, item_list, k=k)
+        else:
+            recommended_items = recommend_full_catalog(user, k=k)
 
     print(f"\n{get_time()} - Returned recommended items: {recommended_items}\n")
 
@@ -71,6 +121,22 @@ def get_top_k_recommendations_tool(user: int, k: int = 5, items: Optional[Union[
     })
 
 
+def top_k_indices(scores, k):
+    """
+    It returns the column indices of the k highest scores of each row, sorted by decreasing score.
+
+    :param scores: score matrix (users x items)
+    :param k: number of indices to be returned for each row
+    :return: matrix of column indices (users x k)
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
 def recommend_full_catalog(user, k=5):
     """
     It generates a ranking for the given user on the entire item catalog using the loaded
@@ -80,9 +146,34 @@ def recommend_full_catalog(user, k=5):
     :param k: number of items to be returned (first k positions in the ranking)
     :return: ranking (of item IDs) for the given user ID
     """
-    topk_score, topk_iid_list = full_sort_topk(user, model, test_data, k=k,
-                                               device=config['device'])
-    return dataset.id2token(dataset.iid_field, topk_iid_list.cpu())[0]
+    return full_catalog_top_k(scorer.user_index([user]), k)[0]
+
+
+def use_ann(exact=False):
+    """
+    :param exact: whether exact rankings are required
+    :return: whether the full-catalog rankings have to be computed through the ANN index
+    """
+    return not exact and RECSYS_USE_ANN and hasattr(scorer, "approximate_top_k")
+
+
+def full_catalog_top_k(user_index, k, scores=None, exact=False):
+    """
+    It ranks the entire catalog for the given users, either exactly or through the ANN index of the
+    item embeddings when RECSYS_USE_ANN is enabled and supported by the backend.
+
+    :param user_index: internal indices of the users
+    :param k: number of items to be returned for each user
+    :param scores: optional score matrix of the users, if it has already been computed
+    :param exact: whether the exact ranking is required, even if RECSYS_USE_ANN is enabled
+    :return: list with the ranking (of item IDs) of each user
+    """
+    if use_ann(exact):
+        top = scorer.approximate_top_k(user_index, k)
+        return [scorer.item_tokens[row[row >= 0]].tolist() for row in top]
+    if scores is None:
+        scores = scorer.scores(user_index)
+    return scorer.item_tokens[top_k_indices(scores, k)].tolist()
 
 
 def recommend_given_items(user, item_ids, k=5):
@@ -94,9 +185,98 @@ def recommend_given_items(user, item_ids, k=5):
     :param k: number of items to be returned (first k positions in the ranking)
     :return: ranking (of item IDs) for the given user ID
     """
-    all_scores = full_sort_scores(user, model, test_data, device=config['device'])
+    all_scores = scorer.scores(scorer.user_index([user]))
     item_ids = [str(i) for i in item_ids]
-    satisfying_item_scores = all_scores[
-        0, dataset.token2id(dataset.iid_field, item_ids)]
-    _, sorted_indices = torch.sort(satisfying_item_scores, descending=True)
-    return [item_ids[i] for i in sorted_indices[:k].cpu().numpy()]
+    satisfying_item_scores = all_scores[0, scorer.item_index(item_ids)]
+    sorted_indices = np.argsort(-satisfying_item_scores, kind="stable")
+    return [item_ids[i] for i in sorted_indices[:k]]
+
+
+@tool(args_schema=BatchTopKRecommendationInput)
+def get_top_k_recommendations_batch_tool(users: List[int], k: int = 5,
+                                         items: Optional[Union[List[int], str]] = None) -> str:
+    """
+    Returns, for each of the given users, a list of the IDs of the top k recommended items.
+    It computes recommendations over the entire item catalog unless a list of items or the handle of a result set
+    containing a list of item is given.
+    """
+    print(f"\n{get_time()} - get_top_k_recommendations_batch has been triggered!!!\n")
+
+    if not users or k is None:
+        return json.dumps(JSON_GENERATION_ERROR)
+
+    if items is not None:
+        try:
+            items = convert_to_list(items)
+        except Exception:
+            return json.dumps({
+                "status": "failure",
+                "message": "There are issues with the result set containing the item IDs.",
+            })
+
+    try:
+        recommended_items = recommend_batch(users, k=k, items=items)
+    except ValueError as e:
+        return json.dumps({
+            "status": "failure",
+            "message": f"Recommendations could not be generated due to: {str(e)}",
+        })
+
+    print(f"\n{get_time()} - Returned recommended items: {recommended_items}\n")
+
+    return json.dumps({
+        "status": "success",
+        "message": f"The top {k} recommendations for users {users} are returned.",
+        "data": recommended_items
+    })
+
+
+def recommend_batch(users, k=5, items=None, batch_size=RECOMMENDATION_BATCH_SIZE, exact=False):
+    """
+    Generates recommendations for many users at once. The users are scored in batches, with a single
+    forward pass of the pre-trained model for each batch, instead of one pass per user.
+
+    :param users: user IDs for which the recommendations have to be generated
+    :param k: number of items to be returned for each user (first k positions in the ranking)
+    :param items: optional candidate items. It can be a list of item IDs shared by all users or a
+    dictionary {user ID: list of item IDs} for per-user candidates. Users missing from the
+    dictionary are ranked on the entire catalog
+    :param batch_size: number of users scored in the same forward pass
+    :param exact: whether the full-catalog rankings have to be exact, even if RECSYS_USE_ANN is enabled
+    :return: dictionary {user ID: ranking (of item IDs)}
+    """
+    ensure_recsys_environment()
+    recommendations = {}
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        user_index = scorer.user_index(batch)
+
+        full_catalog_rows = []
+        candidate_rows = []
+        for row, user in enumerate(batch):
+            candidates = items.get(user) if isinstance(items, dict) else items
+            if candidates is None:
+                full_catalog_rows.append(row)
+            else:
+                candidate_rows.append(row)
+
+        all_scores = None
+        if candidate_rows or not use_ann(exact):
+            all_scores = scorer.scores(user_index)
+
+        for row in candidate_rows:
+            user = batch[row]
+            candidates = items.get(user) if isinstance(items, dict) else items
+            candidates = [str(i) for i in candidates]
+            candidate_scores = all_scores[row, scorer.item_index(candidates)]
+            sorted_indices = np.argsort(-candidate_scores, kind="stable")
+            recommendations[user] = [candidates[i] for i in sorted_indices[:k]]
+
+        if full_catalog_rows:
+            # a single top-k over the score matrix of all the users ranked on the entire catalog
+            rankings = full_catalog_top_k(user_index[full_catalog_rows], k,
+                                          scores=all_scores[full_catalog_rows] if all_scores is not None else None,
+                                          exact=exact)
+            for row, ranking in zip(full_catalog_rows, rankings):
+                recommendations[batch[row]] = ranking
+    return recommendations
@@ -30,8 +30,8 @@ def get_user_metadata_tool(user: int, get: List[AllowedFeatures]) -> str:
 
     specification = get
 
-    sql_query, _, _ = define_sql_query("users", {"user": user, "specification": specification})
-    result = execute_sql_query(sql_query)
+    sql_query, params, _, _ = define_sql_query("users", {"user": user, "specification": specification})
+    result = execute_sql_query(sql_query, params)
 
     if result:
         return_dict = {}
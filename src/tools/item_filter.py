@@ -1,10 +1,9 @@
-import os
 import json
-import hashlib
 from typing import List, Optional, Literal
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
-from src.tools.utils import execute_sql_query, define_sql_query
+from src.tools.utils import filter_items
+from src.result_registry import get_result_registry
 from src.constants import JSON_GENERATION_ERROR
 from src.utils import get_time
 
@@ -63,7 +62,7 @@ def item_filter_tool(actors: Optional[List[str]] = None, genres: Optional[List[s
                      release_date: Optional[ComparisonFilter] = None, release_month: Optional[int] = None,
                      country: Optional[int] = None) -> str:
     """
-    Returns the path to a temporary file containing the IDs of the items that satisfy the given conditions.
+    Returns the handle of a result set containing the IDs of the items that satisfy the given conditions.
     """
     print(f"\n{get_time()} - item_filter has been triggered!!!\n")
 
@@ -89,32 +88,22 @@ def item_filter_tool(actors: Optional[List[str]] = None, genres: Optional[List[s
     if not filters:
         return json.dumps(JSON_GENERATION_ERROR)
 
-    sql_query, corrections, failed_corrections = define_sql_query("items", filters)
+    # the filters are answered by the in-memory item filter index
+    result, corrections, failed_corrections = filter_items(filters)
     mess = ""
-    file_path = None
-
-    if sql_query is not None:
-        result = execute_sql_query(sql_query)
-        item_ids = [str(row[0]) for row in result]
-
-        if item_ids:
-            # Hash-based filename
-            hash_input = ','.join(item_ids).encode('utf-8')
-            filename_hash = hashlib.md5(hash_input).hexdigest()
-            file_path = f"./temp/{filename_hash}.json"
-
-            # Save item IDs to file
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            with open(file_path, "w") as f:
-                json.dump({"items": item_ids}, f)
-
-            print(f"Saved item IDs to {file_path}")
-            mess = (
-                "The IDs of the items satisfying the given conditions have been saved to the returned file path."
-                "If another tool call is needed, you can now proceed to the next tool call. It is enough you pass "
-                "this path to the \"items\" parameter of the next tool call."
-            )
-            matched = True
+    handle = None
+
+    if result is not None and len(result):
+        # the IDs are kept in memory and only their handle is returned to the LLM
+        handle = get_result_registry().put(result)
+
+        print(f"Registered {len(result)} item IDs as {handle}")
+        mess = (
+            "The IDs of the items satisfying the given conditions have been saved under the returned handle."
+            "If another tool call is needed, you can now proceed to the next tool call. It is enough you pass "
+            "this handle to the \"items\" parameter of the next tool call."
+        )
+        matched = True
 
     # Construct the message for LLM
     failed_corr_text = (
@@ -136,12 +125,12 @@ def item_filter_tool(actors: Optional[List[str]] = None, genres: Optional[List[s
 
     if matched or corrections or failed_corrections:
 
-        print(f"\n{get_time()} - Returned path {file_path}\n")
+        print(f"\n{get_time()} - Returned handle {handle}\n")
 
         return json.dumps({
             "status": "success",
             "message": correction_text + no_match_text,
-            "data": file_path if matched else None,
+            "data": handle if matched else None,
         })
 
     return json.dumps(JSON_GENERATION_ERROR)
\ No newline at end of file
@@ -1,153 +1,180 @@
-import sqlite3
-import pandas as pd
-import ast
-from rapidfuzz import process
-from src.constants import DATABASE_NAME
+from src.constants import SQL_RESULT_LOG_LIMIT, ITEM_COLUMNS
+from src.database import get_connection_pool
+from src.item_filter_index import get_item_filter_index
+from src.result_registry import get_result_registry
 import os
 import json
-from src.utils import get_time
+from src.utils import get_time, file_signature, load_ml100k_catalog, ITEMS_FILE, ITEM_LIST_COLUMNS
+from src.fuzzy_matcher import FuzzyMatcher, CACHE_DIR as FUZZY_CACHE_DIR
 
 
-def create_lists_for_fuzzy_matching():
-    # create the lists of actors, directors, producers, and genres for fuzzy matching
-    global actors_list, producers_list, directors_list, genres_list, countries_list
-    actors_list = extract_unique_names("./data/ml-100k/final_ml-100k.csv", "actors_list")
-    producers_list = extract_unique_names("./data/ml-100k/final_ml-100k.csv",
-                                          "producers_list")
-    directors_list = extract_unique_names("./data/ml-100k/final_ml-100k.csv",
-                                          "directors_list")
-    genres_list = extract_unique_names("./data/ml-100k/final_ml-100k.csv", "genres_list")
-    countries_list = extract_unique_names("./data/ml-100k/final_ml-100k.csv", "country")
+# textual features and the columns of the dataset CSV file their valid names are extracted from
+FUZZY_MATCHING_COLUMNS = {
+    "actors": "actors_list",
+    "producer": "producers_list",
+    "director": "directors_list",
+    "genres": "genres_list",
+    "country": "country",
+}
 
 
-def execute_sql_query(sql_query):
+def create_lists_for_fuzzy_matching():
+    # create the matchers of actors, directors, producers, genres, and countries for fuzzy matching.
+    # They are saved to disk and rebuilt only when the dataset CSV file changes
+    global matchers
+    signature = list(file_signature(ITEMS_FILE))
+    matchers = {}
+    for feature, column in FUZZY_MATCHING_COLUMNS.items():
+        path = os.path.join(FUZZY_CACHE_DIR, f"{feature}.npz")
+        matcher = FuzzyMatcher.load(path, signature)
+        if matcher is None:
+            matcher = FuzzyMatcher(extract_unique_names(column))
+            matcher.save(path, signature)
+        matchers[feature] = matcher
+
+
+def execute_sql_query(sql_query, params=(), log_limit=SQL_RESULT_LOG_LIMIT):
     """
-    This function executes the given SQL query and returns the result.
+    This function executes the given SQL query on the pooled read-only connection of the calling
+    thread and returns the result.
 
-    :param sql_query: SQL query string
+    :param sql_query: SQL query string, possibly with "?" placeholders
+    :param params: values bound to the placeholders of the query
+    :param log_limit: maximum number of result rows printed to stdout (0 disables the logging)
     :return: result of the query
     """
-    conn = sqlite3.connect(f'{DATABASE_NAME}.db')
-    cursor = conn.cursor()
-    cursor.execute(sql_query)
-    result = cursor.fetchall()
-    conn.close()
-    print(f"\n{get_time()} - The result of the query {sql_query} is: \n{str(result)}\n")
+    result = get_connection_pool().execute(sql_query, params)
+    if log_limit > 0:
+        shown = result if len(result) <= log_limit else result[:log_limit]
+        omitted = f" ... ({len(result) - log_limit} more rows)" if len(result) > log_limit else ""
+        print(f"\n{get_time()} - The result of the query {sql_query} is: \n{str(shown)}{omitted}\n")
     return result
 
 
+def in_list_condition(column, values, params):
+    """
+    It builds an "IN" condition over a list of values. The list is bound as a single JSON parameter
+    expanded through `json_each`, so that the SQL text, and hence the prepared statement, does not
+    change with the length of the list.
+
+    :param column: column name
+    :param values: list of values
+    :param params: list where the bound parameter is appended
+    :return: SQL condition string
+    """
+    params.append(json.dumps([int(v) for v in values]))
+    return f"{column} IN (SELECT value FROM json_each(?))"
+
+
 def define_sql_query(table, conditions):
     """
     This function defines a SQL query given the passed conditions (filter
     argument in the LLM-generated JSON for function calling)
     :param table: database table name
     :param conditions: filters to create SQL query
-    :return: SQL query string ready to be executed
+    :return: SQL query string ready to be executed, the values bound to its placeholders, the
+    corrections performed by fuzzy matching, and the failed corrections
     """
     query_parts = []
+    params = []
     corrections, failed_corrections = [], []
     requested_field = None
     if table == "interactions":
         if 'user' in conditions:
-            user_id = conditions['user']
-            query_parts.append(f'user_id = {user_id}')
-            requested_field = "items"
+            # the items are returned from the most recent, optionally limited to the given number
+            sql_query = "SELECT item_id FROM interactions WHERE user_id = ? ORDER BY timestamp DESC, item_id DESC"
+            params.append(int(conditions['user']))
+            if 'limit' in conditions:
+                sql_query += " LIMIT ?"
+                params.append(int(conditions['limit']))
+            print(f"\n{get_time()} - Generated query: {sql_query}\n")
+            return sql_query, params, corrections, failed_corrections
         else:
-            return None
-    elif table == "items" and ('genres' in conditions or 'actors' in conditions or
-                               'director' in conditions or 'producer' in conditions or
-                               'release_date' in conditions or 'duration' in conditions or
-                               'imdb_rating' in conditions or 'release_month' in conditions or
-                               'country' in conditions):
-        # process textual features
-        process_textual("genres", conditions, genres_list, query_parts, corrections, failed_corrections)
-        process_textual("actors", conditions, actors_list, query_parts, corrections, failed_corrections)
-        process_textual("director", conditions, directors_list, query_parts, corrections, failed_corrections)
-        process_textual("producer", conditions, producers_list, query_parts, corrections, failed_corrections)
-        process_textual("country", conditions, countries_list, query_parts, corrections, failed_corrections)
-
-        # process numerical features
-        process_numerical("release_date", conditions, query_parts)
-        process_numerical("release_month", conditions, query_parts)
-        process_numerical("duration", conditions, query_parts)
-        process_numerical("imdb_rating", conditions, query_parts)
-
-        requested_field = "item_id"
-    elif table == "items" and 'specification' in conditions and 'items' in conditions:
-        specification = conditions['specification']
-        items = conditions['items']
-        requested_field = ", ".join(specification)
-        query_parts.append(f"item_id IN ({', '.join([str(i) for i in items])})")
-    elif table == "items" and "select" in conditions:
-        if "items" in conditions:
-            query_parts.append(f"item_id IN ({', '.join([str(i) for i in conditions['items']])})")
-        requested_field = ", ".join(conditions['select'])
+            return None, params, corrections, failed_corrections
     elif table == "users" and "specification" in conditions and "user" in conditions:
         specification = conditions['specification']
         user = [conditions['user']] if not isinstance(conditions['user'], list) else conditions['user']
         requested_field = ", ".join(specification)
-        query_parts.append(f"user_id IN ({', '.join([str(i) for i in user])})")
+        query_parts.append(in_list_condition("user_id", user, params))
     else:
-        return None, corrections, failed_corrections
+        return None, params, corrections, failed_corrections
     if requested_field is not None and query_parts:
         sql_query = f"SELECT {requested_field} FROM {table} WHERE {' AND '.join(query_parts)}"
         print(f"\n{get_time()} - Generated query: {sql_query}\n")
-        return sql_query, corrections, failed_corrections
-    elif requested_field is not None and not query_parts and "select" in conditions:
-        sql_query = f"SELECT {requested_field} FROM {table}"
-        print(f"\n{get_time()} - Generated query: {sql_query}\n")
-        return sql_query, corrections, failed_corrections
+        return sql_query, params, corrections, failed_corrections
     else:
-        return None, corrections, failed_corrections
+        return None, params, corrections, failed_corrections
 
 
-def extract_unique_names(csv_path, column):
+def filter_items(conditions):
     """
-    This function extracts unique names from a column of the dataset CSV file. The returned list
-    is used to implement fuzzy matching when performing SQL queries. Note fuzzy matching is only
-    performed for textual features.
-
-    :param csv_path: path to the CSV file
-    :param column: column name
-    :return: list of unique names
+    This function returns the items satisfying the passed conditions (filter argument in the
+    LLM-generated JSON for function calling). The conditions are answered by the in-memory item
+    filter index: textual names are corrected by fuzzy matching and looked up in the inverted index,
+    numerical comparisons are answered by binary search on the sorted columns, and all of them are
+    AND-ed together.
+
+    :param conditions: filters on the item features
+    :return: sorted array of the matching item IDs (None if no valid condition has been given), the
+    corrections performed by fuzzy matching, and the failed corrections
     """
-    df = pd.read_csv(csv_path, sep='\t')
+    matches, ranges = [], []
+    corrections, failed_corrections = [], []
+    # process textual features
+    process_textual("genres", conditions, matchers["genres"], matches, corrections, failed_corrections)
+    process_textual("actors", conditions, matchers["actors"], matches, corrections, failed_corrections)
+    process_textual("director", conditions, matchers["director"], matches, corrections, failed_corrections)
+    process_textual("producer", conditions, matchers["producer"], matches, corrections, failed_corrections)
+    process_textual("country", conditions, matchers["country"], matches, corrections, failed_corrections)
+
+    # process numerical features
+    process_numerical("release_date", conditions, ranges)
+    process_numerical("release_month", conditions, ranges)
+    process_numerical("duration", conditions, ranges)
+    process_numerical("imdb_rating", conditions, ranges)
+
+    print(f"\n{get_time()} - Filtering items by {matches + ranges}\n")
+    return get_item_filter_index().match(matches, ranges), corrections, failed_corrections
 
-    all_names = set()
 
-    for row in df[column].dropna():
-        try:
-            # check if it is list
-            if "[" in row and "]" in row:
-                # if it is a list inside a string, we need to evaluate it to get the real list
-                name_list = ast.literal_eval(row)
-                if not isinstance(name_list, list):
-                    name_list = [name_list]
-            else:
-                name_list = [row]
-            all_names.update(name.strip() for name in name_list)
-        except Exception as e:
-            print(f"Error parsing row: {row}\n{e}")
+def extract_unique_names(column):
+    """
+    This function extracts unique names from a column of the dataset. The returned list is used to
+    implement fuzzy matching when filtering the items. Note fuzzy matching is only performed for
+    textual features.
 
+    :param column: column name, either a list column (e.g., actors_list) or a column of the items table
+    :return: list of unique names
+    """
+    items, item_lists = load_ml100k_catalog()
+    all_names = set()
+    if column in ITEM_LIST_COLUMNS:
+        for lists in item_lists.values():
+            all_names.update(lists[column])
+    else:
+        position = ITEM_COLUMNS.index(column)
+        all_names.update(row[position].strip() for row in items if row[position] is not None)
     return sorted(all_names)
 
 
-def process_textual(feature, conditions, names_list, query_parts, corrections, failed_corrections):
+def process_textual(feature, conditions, matcher, matches, corrections, failed_corrections):
     """
-    Process a textual feature for creating the SQL query.
+    Process a textual feature for filtering the items.
 
     :param feature: name of the feature to be processed
     :param conditions: the filters provided by the user in the prompt
-    :param names_list: list of valid names
-    :param query_parts: str where to append the query part processed by this functions
+    :param matcher: fuzzy matcher of the valid names
+    :param matches: list where the (feature, corrected name) pairs to be matched are appended
     :param corrections: list of corrections performed thanks to fuzzy matching
     :param failed_corrections: list of failed corrections
     """
     if feature in conditions:
         f = conditions[feature]
+        if isinstance(f, str):
+            f = [f]
         for f_ in f:
             # perform fuzzy matching
-            f_corrected = correct_name(f_, names_list)
+            f_corrected = correct_name(f_, matcher)
             if f_corrected is None:
                 print(f"ERROR: {f_} is not a valid label for feature {feature}")
                 failed_corrections.append(f_)
@@ -155,51 +182,51 @@ def process_textual(feature, conditions, names_list, query_parts, corrections, f
             if f_corrected != f_:
                 print(f"Corrected name {f_} with name {f_corrected}")
                 corrections.append(f"{f_} -> {f_corrected}")
-            query_parts.append(f"LOWER({feature}) LIKE '%{f_corrected.lower()}%'")
+            matches.append((feature, f_corrected))
 
 
-def correct_name(input_name, candidates, threshold=70):
+def correct_name(input_name, matcher, threshold=70):
     """
     Returns the best fuzzy match if above threshold; otherwise returns None.
     """
     print(f"Trying correcting name {input_name}")
-    match, score, _ = process.extractOne(input_name, candidates)
-    if score >= threshold:
+    match = matcher.correct(input_name, threshold)
+    if match is not None:
         return match
     print(f"Failed to correct name {input_name}")
     return None
 
 
-def process_numerical(feature, conditions, query_parts):
+def process_numerical(feature, conditions, ranges):
     """
-    Process a numerical feature for creating the SQL query.
+    Process a numerical feature for filtering the items.
 
     :param feature: name of the feature to be processed
     :param conditions: conditions provided by the user in the prompt
-    :param query_parts: str where to append the query part processed by this functions
+    :param ranges: list where the (feature, request, threshold) comparison is appended, where request
+    is "higher", "lower", or "exact"
     """
     if feature in conditions:
         f = conditions[feature]
-        request = None
+        request = "exact"
         if isinstance(f, dict):
             request = f['request']
             f = f['threshold']
-        if request is not None:
-            query_parts.append(
-                f"{feature} > {f}") if request == "higher" else query_parts.append(
-                f"{feature} < {f}")
-        else:
-            query_parts.append(f"{feature} = {f}")
+        ranges.append((feature, request, f))
 
 
 def convert_to_list(items):
     """
-    It takes a list of item IDs or a path to a JSON file containing a list of item IDs.
-    If `items` is a string containing the path, then it converts the content to a list.
+    It takes a list of item IDs, the handle of a result set returned by another tool, or a path to a
+    JSON file containing a list of item IDs (as returned by the previous versions of the tools).
+    If `items` is a string, then it converts the referenced content to a list. Handles are resolved
+    from the in-memory result set registry, without touching the filesystem.
     :param items: list or string
     :return: list of item IDs
     """
-    if isinstance(items, str):
+    if get_result_registry().is_handle(items):
+        items = get_result_registry().get(items).tolist()
+    elif isinstance(items, str):
         # Assume it's a path to a JSON file
         if not os.path.exists(items):
             raise FileNotFoundError(f"Item list file not found: {items}")
@@ -3,12 +3,10 @@ from typing import List, Optional, Union
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 from langchain.tools import tool
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchAny, SearchParams
-from sentence_transformers import SentenceTransformer
 from src.tools.utils import convert_to_list
 from src.utils import get_time
-from src.constants import JSON_GENERATION_ERROR, COLLECTION_NAME
+from src.vector_store import get_vector_store_service
+from src.constants import JSON_GENERATION_ERROR
 
 load_dotenv()
 
@@ -18,83 +16,94 @@ class VectorStoreSearchParams(BaseModel):
     items: Optional[Union[List[int], str]] = Field(
         None,
         description="Item ID(s) that have to be included in the vector store search, either directly as a list or as "
-                    "a path to a JSON file."
+                    "the handle of a result set returned by another tool."
     )
+    k: int = Field(default=10, description="Number of matching items to be returned.")
+    score_threshold: Optional[float] = Field(
+        default=None,
+        description="Minimum similarity (between -1 and 1) of the returned items with the query."
+    )
+
+
+class BatchVectorStoreSearchParams(BaseModel):
+    queries: List[str] = Field(..., description="Queries to perform the vector store searches.")
+    items: Optional[List[Optional[Union[List[int], str]]]] = Field(
+        None,
+        description="One entry per query with the item ID(s) that have to be included in its search, either directly "
+                    "as a list or as the handle of a result set returned by another tool, or null to search all the "
+                    "items."
+    )
+    k: int = Field(default=10, description="Number of matching items to be returned for each query.")
+    score_threshold: Optional[float] = Field(
+        default=None,
+        description="Minimum similarity (between -1 and 1) of the returned items with the query."
+    )
+
+
+def matching_item_ids(hits: dict, query: str, k: int) -> List[str]:
+    """
+    Extracts the IDs of the matching items from the hits of a search.
+
+    :param hits: dictionary with the hits of the search under the "points" key
+    :param query: query of the search. Items whose storyline is the query itself are left out
+    :param k: maximum number of item IDs to be returned
+    :return: item IDs sorted by decreasing similarity
+    """
+    # Collect metadata
+    item_metadata = {
+        str(hit["payload"]["item_id"]): {
+            "item_id": str(hit["payload"]["item_id"]),
+            "storyline": hit["payload"].get("storyline", None)
+        }
+        for hit in hits["points"] if "payload" in hit.keys() and "item_id" in hit["payload"]
+    }
+
+    # Filter out self-matches
+    item_metadata = {
+        k: v for k, v in item_metadata.items()
+        if v['storyline'] is not None and v['storyline'] != query
+    }
+
+    return list(item_metadata.keys())[:k]
 
 
 @tool(args_schema=VectorStoreSearchParams)
-def vector_store_search_tool(query: str, items: Optional[Union[List[int], str]] = None) -> str:
+def vector_store_search_tool(query: str, items: Optional[Union[List[int], str]] = None, k: int = 10,
+                             score_threshold: Optional[float] = None) -> str:
     """
-    Performs a vector store search and returns the 10 top matching item IDs.
+    Performs a vector store search and returns the k top matching item IDs (10 by default).
     """
     print(f"\n{get_time()} - vector_store_search_tool has been triggered!!!\n")
 
-    if query is None:
+    if query is None or k is None:
         return json.dumps(JSON_GENERATION_ERROR)
 
     try:
-        # Load env variables
-        collection_name = COLLECTION_NAME
-        top_k = 11
-
-        # Connect to local Qdrant instance
-        client = QdrantClient(url="http://localhost:6333")
-
-        # Encode query
-        embedder = SentenceTransformer("paraphrase-MiniLM-L6-v2")
-        query_vector = embedder.encode(
-            query,
-            convert_to_numpy=True,
-            normalize_embeddings=True
-        ).tolist()
+        # one more hit, in case the query is the storyline of one of the items
+        top_k = k + 1
+
+        # the embedding model and the vector backend are shared across calls
+        service = get_vector_store_service()
+
         print(f"\n{get_time()} - Performing vector store search with query: {query}.\n")
         # Build optional filters
-        qdrant_filter = None
         if items is not None and items:
             try:
                 items = convert_to_list(items)
             except Exception:
                 return json.dumps({
                     "status": "failure",
-                    "message": "There are issues with the temporary file containing the item IDs."
+                    "message": "There are issues with the result set containing the item IDs."
                 })
             items = [int(i) for i in items]
-            qdrant_filter = Filter(
-                must=[
-                    FieldCondition(
-                        key="item_id",
-                        match=MatchAny(any=items)
-                    )
-                ]
-            )
-
-
-        # Perform the search
-        hits = client.query_points(
-            collection_name=collection_name,
-            query=query_vector,
-            limit=top_k,
-            query_filter=qdrant_filter,
-            search_params=SearchParams(hnsw_ef=128),
-            with_payload=True
-        ).model_dump()
-
-        # Collect metadata
-        item_metadata = {
-            str(hit["payload"]["item_id"]): {
-                "item_id": str(hit["payload"]["item_id"]),
-                "storyline": hit["payload"].get("storyline", None)
-            }
-            for hit in hits["points"] if "payload" in hit.keys() and "item_id" in hit["payload"]
-        }
+        else:
+            items = None
 
-        # Filter out self-matches
-        item_metadata = {
-            k: v for k, v in item_metadata.items()
-            if v['storyline'] is not None and v['storyline'] != query
-        }
+        # Perform the search (the query embedding and the hits are cached across calls)
+        hits = service.search_query(query, limit=top_k, items=items, score_threshold=score_threshold)
+        print(f"\n{get_time()} - Vector store cache statistics: {service.cache_stats()}\n")
 
-        item_ids = list(item_metadata.keys())
+        item_ids = matching_item_ids(hits, query, k)
 
         print(f"\n{get_time()} - Returned list: {item_ids}\n")
 
@@ -109,3 +118,58 @@ def vector_store_search_tool(query: str, items: Optional[Union[List[int], str]]
             "status": "failure",
             "message": f"Vector store search failed due to: {str(e)}"
         })
+
+
+@tool(args_schema=BatchVectorStoreSearchParams)
+def vector_store_search_batch_tool(queries: List[str], items: Optional[List[Optional[Union[List[int], str]]]] = None,
+                                   k: int = 10, score_threshold: Optional[float] = None) -> str:
+    """
+    Performs several vector store searches at once and returns, for each query, the k top matching item IDs
+    (10 by default).
+    """
+    print(f"\n{get_time()} - vector_store_search_batch_tool has been triggered!!!\n")
+
+    if not queries or k is None or (items is not None and len(items) != len(queries)):
+        return json.dumps(JSON_GENERATION_ERROR)
+
+    try:
+        service = get_vector_store_service()
+
+        print(f"\n{get_time()} - Performing {len(queries)} vector store searches with queries: {queries}.\n")
+        # Build optional per-query filters
+        filters = []
+        for query_items in (items if items is not None else [None] * len(queries)):
+            if query_items is not None and query_items:
+                try:
+                    query_items = convert_to_list(query_items)
+                except Exception:
+                    return json.dumps({
+                        "status": "failure",
+                        "message": "There are issues with the result set containing the item IDs."
+                    })
+                filters.append([int(i) for i in query_items])
+            else:
+                filters.append(None)
+
+        # all the queries are encoded together and sent to the vector backend in a single batch
+        all_hits = service.search_queries(queries, limit=k + 1, items=filters, score_threshold=score_threshold)
+        print(f"\n{get_time()} - Vector store cache statistics: {service.cache_stats()}\n")
+
+        # one entry per query, in the order of the queries, so that repeated queries with different filters are kept
+        matches = [{"query": query, "items": matching_item_ids(hits, query, k)}
+                   for query, hits in zip(queries, all_hits)]
+
+        print(f"\n{get_time()} - Returned lists: {matches}\n")
+
+        return json.dumps({
+            "status": "success",
+            "message": f"The IDs of the best matching items produced by the {len(queries)} vector store searches "
+                       f"are returned for each query, in the order of the queries.",
+            "data": matches
+        })
+
+    except Exception as e:
+        return json.dumps({
+            "status": "failure",
+            "message": f"Vector store search failed due to: {str(e)}"
+        })
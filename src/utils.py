@@ -1,26 +1,66 @@
 import sqlite3
+import json
 import re
-from src.constants import DATABASE_NAME, COLLECTION_NAME
+import ast
+import csv
+import pickle
+import hashlib
+from src.constants import DATABASE_NAME, COLLECTION_NAME, ITEM_COLUMNS, EMBEDDING_MODEL_NAME, \
+    EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS, UPSERT_BATCH_SIZE, VECTOR_BACKEND
+from src.database import database_rebuilt
+from src.vector_backends import get_vector_backend
 import time
-import pandas as pd
 from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-import uuid
+import numpy as np
 import docker
 from docker.errors import ImageNotFound, NotFound
 import os
 
 
+ITEMS_FILE = './data/ml-100k/final_ml-100k.csv'
+RATINGS_FILE = './data/ml-100k/ml-100k.inter'
+USERS_FILE = './data/ml-100k/ml-100k.user'
+# list columns of the item metadata file, which follow the ITEM_COLUMNS
+ITEM_LIST_COLUMNS = ('genres_list', 'directors_list', 'producers_list', 'actors_list')
+CATALOG_CACHE = './cache/catalog/ml-100k.pkl'
+# (source signature, parsed catalog) of the last loaded item metadata file
+_catalog_records = None
+# version of the way the tables are built from the source files, to be increased when it changes
+DATABASE_BUILD_VERSION = 2
+
+
 def create_ml100k_db():
     """
     This function creates the database and tables needed for MovieLens-100k dataset. The metadata
     table contains item metadata (title, release date, and genres). The name of the table is 'items'.
-    The interaction table contains user historical interactions (list of item IDs for each user
-    of the dataset). The name of the table is 'interactions'. These tables are both used in the app.
+    The interaction table contains user historical interactions (one row for each user, item, rating,
+    and timestamp of the dataset). The name of the table is 'interactions'. These tables are both used
+    in the app.
+
+    The build is incremental: a manifest table records the size, modification time, and hash of every
+    source file, and a table is synchronized only when its source file changed. In that case, only the
+    rows that differ from the ones in the database are written, all in a single transaction.
     """
     conn = sqlite3.connect(f'{DATABASE_NAME}.db')
+    # WAL mode is persistent and lets the pooled read-only connections read while the database is written
+    conn.execute('PRAGMA journal_mode=WAL')
+    # transactions are handled explicitly, so that the whole build is atomic
+    conn.isolation_level = None
     cursor = conn.cursor()
+    cursor.execute('BEGIN')
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS build_manifest (
+                    source TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    sha256 TEXT)''')
+
+    # the tables are synchronized again when the way they are built from the source files changes
+    cursor.execute("SELECT sha256 FROM build_manifest WHERE source = 'build_version'")
+    if cursor.fetchone() != (str(DATABASE_BUILD_VERSION),):
+        cursor.execute('DELETE FROM build_manifest')
+        cursor.execute("INSERT INTO build_manifest (source, sha256) VALUES ('build_version', ?)",
+                       (str(DATABASE_BUILD_VERSION),))
 
     cursor.execute('''CREATE TABLE IF NOT EXISTS items (
                     item_id INTEGER PRIMARY KEY,
@@ -47,14 +87,188 @@ def create_ml100k_db():
                     description TEXT,
                     storyline TEXT)''')
 
-    # load data
-    with open('./data/ml-100k/final_ml-100k.csv', 'r', encoding='utf-8') as f:
-        first_line = True
-        for line in f:
-            if first_line:
-                first_line = False
+    # databases built before the normalization store the history of every user as a single string
+    if 'items' in [column[1] for column in cursor.execute('PRAGMA table_info(interactions)')]:
+        cursor.execute('DROP TABLE interactions')
+        cursor.execute('DELETE FROM build_manifest WHERE source = ?', (RATINGS_FILE,))
+
+    cursor.execute('''CREATE TABLE IF NOT EXISTS interactions (
+                    user_id INTEGER,
+                    item_id INTEGER,
+                    rating FLOAT,
+                    timestamp INTEGER,
+                    PRIMARY KEY (user_id, item_id))''')
+    # covering indexes for the most recent items of a user and for the users of a set of items
+    cursor.execute('CREATE INDEX IF NOT EXISTS interactions_user_timestamp '
+                   'ON interactions (user_id, timestamp, item_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS interactions_item ON interactions (item_id, user_id)')
+
+    # create user table
+    cursor.execute('''CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, age_category TEXT, gender TEXT)''')
+
+    # every table is built from a single source file
+    tables = [
+        ('items', 'item_id', ITEMS_FILE, read_ml100k_items),
+        ('interactions', ('user_id', 'item_id'), RATINGS_FILE, read_ml100k_ratings),
+        ('users', 'user_id', USERS_FILE, read_ml100k_users),
+    ]
+
+    changed = 0
+    try:
+        for table, key, source, read_rows in tables:
+            if not source_changed(cursor, source):
                 continue
-            parts = line.strip().split('\t')
+            changed += sync_table(cursor, table, key, read_rows())
+            update_manifest(cursor, source)
+        cursor.execute('COMMIT')
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    if changed:
+        print(f"\n{get_time()} - Database updated: {changed} rows written or deleted.\n")
+        # pooled connections and in-memory copies of the tables must not keep serving the old content
+        database_rebuilt()
+
+
+def file_signature(path):
+    """
+    Returns the size and modification time of the given file, which are cheap to read and change
+    whenever the file is written.
+
+    :param path: path to the file
+    :return: tuple (size, mtime_ns)
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def file_sha256(path):
+    """
+    Computes the SHA-256 hash of the given file, reading it in chunks.
+
+    :param path: path to the file
+    :return: hex digest of the file
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_changed(cursor, source):
+    """
+    Checks whether the given source file changed since the last build. The file is hashed only if its
+    size or modification time changed, and a file that has just been touched is not considered changed.
+
+    :param cursor: cursor of the database being built
+    :param source: path to the source file
+    :return: whether the tables built from the file must be synchronized
+    """
+    cursor.execute('SELECT size, mtime_ns, sha256 FROM build_manifest WHERE source = ?', (source,))
+    entry = cursor.fetchone()
+    if entry is None:
+        return True
+    if file_signature(source) == tuple(entry[:2]):
+        return False
+    if file_sha256(source) == entry[2]:
+        # same content, only the signature has to be refreshed
+        update_manifest(cursor, source, entry[2])
+        return False
+    return True
+
+
+def update_manifest(cursor, source, sha256=None):
+    """
+    Records the current signature and hash of the given source file in the build manifest.
+
+    :param cursor: cursor of the database being built
+    :param source: path to the source file
+    :param sha256: hash of the file, computed if not given
+    """
+    size, mtime_ns = file_signature(source)
+    cursor.execute('INSERT OR REPLACE INTO build_manifest (source, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)',
+                   (source, size, mtime_ns, sha256 or file_sha256(source)))
+
+
+def sync_table(cursor, table, key, rows):
+    """
+    Makes the content of a table equal to the given rows, writing only the rows that differ.
+
+    :param cursor: cursor of the database being built
+    :param table: name of the table
+    :param key: name of the primary key column, or tuple of names for a composite key. The key columns
+    must be the first columns of the table
+    :param rows: list of row tuples, with values in the same order as the columns of the table
+    :return: number of rows written or deleted
+    """
+    key = (key,) if isinstance(key, str) else tuple(key)
+    existing = {row[:len(key)]: row for row in cursor.execute(f'SELECT * FROM {table}')}
+    # with duplicated keys, the first row is kept
+    unique_rows = {}
+    for row in rows:
+        unique_rows.setdefault(row[:len(key)], tuple(row))
+    rows = unique_rows
+    changed = [row for row_id, row in rows.items() if existing.get(row_id) != row]
+    removed = list(existing.keys() - rows.keys())
+    if changed:
+        cursor.executemany(f'INSERT OR REPLACE INTO {table} VALUES ({", ".join("?" * len(changed[0]))})', changed)
+    if removed:
+        condition = " AND ".join(f"{column} = ?" for column in key)
+        cursor.executemany(f'DELETE FROM {table} WHERE {condition}', removed)
+    return len(changed) + len(removed)
+
+
+def load_ml100k_catalog():
+    """
+    It returns the parsed MovieLens-100k item metadata file. The file is parsed in a single pass,
+    list columns included, and the typed result is cached to a pickle file, so the file is parsed
+    again only when it changes. The same in-memory copy feeds the database build, the lists for fuzzy
+    matching, and the vector store.
+
+    :return: tuple (items, item_lists), where items is the list of item tuples, with values in the
+    same order as `ITEM_COLUMNS`, and item_lists is a dictionary {item_id: {list column: list of names}}
+    """
+    global _catalog_records
+    signature = file_signature(ITEMS_FILE)
+    if _catalog_records is not None and _catalog_records[0] == signature:
+        return _catalog_records[1]
+    catalog = None
+    try:
+        with open(CATALOG_CACHE, 'rb') as f:
+            cached_signature, cached_catalog = pickle.load(f)
+        if tuple(cached_signature) == signature:
+            catalog = cached_catalog
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        pass
+    if catalog is None:
+        catalog = parse_ml100k_catalog()
+        os.makedirs(os.path.dirname(CATALOG_CACHE), exist_ok=True)
+        # written to a temporary file first, so a concurrent reader never loads a partial file
+        tmp_path = f"{CATALOG_CACHE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((signature, catalog), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, CATALOG_CACHE)
+    _catalog_records = (signature, catalog)
+    return catalog
+
+
+def parse_ml100k_catalog():
+    """
+    It parses the MovieLens-100k item metadata file. The file is read with a CSV parser, as some
+    columns contain quoted values and line breaks.
+
+    :return: tuple (items, item_lists), as returned by `load_ml100k_catalog`
+    """
+    items = []
+    item_lists = {}
+    with open(ITEMS_FILE, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        next(reader)
+        for parts in reader:
             if len(parts) < 16:
                 continue  # skip lines with missing data
 
@@ -82,65 +296,89 @@ def create_ml100k_db():
             n_ratings_female = int(parts[21])
             storyline = parts[22] if parts[22] != 'unknown' else None
 
-            # Insert into the table
-            cursor.execute('INSERT OR IGNORE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                           (item_id, movie_title, genres, director, producer, actors,
-                            release_date, release_month, country, duration, age_rating, imdb_rating,
-                            imdb_num_reviews,
-                            n_ratings, n_ratings_kid, n_ratings_teenager, n_ratings_young_adult,
-                            n_ratings_adult, n_ratings_senior, n_ratings_male, n_ratings_female,
-                            description, storyline))
+            items.append((item_id, movie_title, genres, director, producer, actors,
+                          release_date, release_month, country, duration, age_rating, imdb_rating,
+                          imdb_num_reviews,
+                          n_ratings, n_ratings_kid, n_ratings_teenager, n_ratings_young_adult,
+                          n_ratings_adult, n_ratings_senior, n_ratings_male, n_ratings_female,
+                          description, storyline))
+            item_lists[item_id] = {
+                column: parse_name_list(value)
+                for column, value in zip(ITEM_LIST_COLUMNS, parts[len(ITEM_COLUMNS):])
+            }
+    return items, item_lists
 
-    cursor.execute('''CREATE TABLE IF NOT EXISTS interactions (user_id INTEGER PRIMARY KEY, items TEXT)''')
 
-    # Read the file and build the dictionary
-    user_interactions = read_ml100k_ratings()
+def parse_name_list(value):
+    """
+    It parses a list column of the item metadata file (e.g., "['Horror', 'Thriller']").
 
-    # Sort by timestamp
-    user_interactions.sort(key=lambda x: x[2])
+    :param value: raw value of the column
+    :return: list of names, empty if the value is unknown
+    """
+    if not value or value == 'unknown':
+        return []
+    names = ast.literal_eval(value) if '[' in value and ']' in value else [value]
+    if not isinstance(names, list):
+        names = [names]
+    return [name.strip() for name in names]
 
-    # Build dictionary with timestamp-ordered items
-    user_interactions_dict = {}
-    for user_id, item_id, _ in user_interactions:
-        if user_id not in user_interactions_dict:
-            user_interactions_dict[user_id] = []
-        user_interactions_dict[user_id].append(item_id)
 
-    # Insert data into the table
-    for user_id, items in user_interactions_dict.items():
-        items_str = ','.join(map(str, items))
-        cursor.execute('INSERT OR REPLACE INTO interactions (user_id, items) VALUES (?, ?)',
-                       (user_id, items_str))
+def read_ml100k_items():
+    """
+    It returns the items of the MovieLens-100k item metadata file.
 
-    # create user table
-    cursor.execute('''CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, age_category TEXT, gender TEXT)''')
+    :return: list of item tuples, with values in the same order as `ITEM_COLUMNS`
+    """
+    return load_ml100k_catalog()[0]
+
+
+def read_ml100k_ratings():
+    """
+    It parses the MovieLens-100k ratings file.
 
-    with open('./data/ml-100k/ml-100k.user', 'r') as f:
+    :return: list of (user_id, item_id, rating, timestamp) tuples
+    """
+    user_interactions = []
+    with open(RATINGS_FILE, 'r') as f:
         first_line = True
         for line in f:
             if first_line:
                 first_line = False
                 continue
-            user_id, age, gender, occupation, location = line.strip().split('\t')
-            cursor.execute('INSERT OR REPLACE INTO users (user_id, age_category, gender) VALUES (?, ?, ?)',
-                           (user_id, convert_age_to_string(int(age)), gender))
-
+            user_id, item_id, rating, timestamp = line.strip().split('\t')
+            user_interactions.append((int(user_id), int(item_id), float(rating), int(timestamp)))
+    return user_interactions
 
-    conn.commit()
-    conn.close()
 
+def read_ml100k_users():
+    """
+    It parses the MovieLens-100k user file.
 
-def read_ml100k_ratings():
-    user_interactions = []
-    with open('./data/ml-100k/ml-100k.inter', 'r') as f:
+    :return: list of (user_id, age_category, gender) tuples
+    """
+    users = []
+    with open(USERS_FILE, 'r') as f:
         first_line = True
         for line in f:
             if first_line:
                 first_line = False
                 continue
-            user_id, item_id, rating, timestamp = line.strip().split('\t')
-            user_interactions.append((int(user_id), int(item_id), int(timestamp)))
-    return user_interactions
+            user_id, age, gender, occupation, location = line.strip().split('\t')
+            users.append((int(user_id), convert_age_to_string(int(age)), gender))
+    return users
+
+
+def read_ml100k_item_lists(columns=ITEM_LIST_COLUMNS):
+    """
+    It returns the list columns of the MovieLens-100k item metadata file (e.g., the list of actors of
+    every movie).
+
+    :param columns: names of the list columns to be returned
+    :return: dictionary {item_id: {column: list of names}}
+    """
+    return {item_id: {column: lists[column] for column in columns}
+            for item_id, lists in load_ml100k_catalog()[1].items()}
 
 
 def convert_age_to_string(age):
@@ -201,87 +439,157 @@ def get_time():
     return time.strftime("%H:%M:%S - %d-%m-%Y", local_time)
 
 
-def create_vector_store():
+def build_embedding_text(mv):
     """
-    It creates a local Qdrant vector store with MovieLens movies descriptions.
+    It builds the text embedded in the vector store for a movie.
+
+    :param mv: dictionary with the item columns of the movie
+    :return: text made of the title, the genres, and the storyline of the movie
     """
-    # Load your movie dataset
-    movies = pd.read_csv(
-        "./data/ml-100k/final_ml-100k.csv",
-        sep="\t",
-        encoding="latin-1"
-    )
+    fields = [f"Title: {mv['title']}"]
+
+    if mv["genres"] is not None:
+        fields.append(f"Genres: {mv['genres']}")
+
+    if mv["storyline"] is not None:
+        fields.append(f"Storyline: {mv['storyline']}")
+
+    return ". \n".join(fields) + "."
+
+
+def encode_texts(model, texts, pool=None):
+    """
+    It encodes the given texts in batches of `EMBEDDING_BATCH_SIZE`.
+
+    :param model: SentenceTransformer model
+    :param texts: list of texts
+    :param pool: optional multi-process pool of the model, used to encode with several worker processes
+    :return: matrix of normalized embeddings (texts x dimensions)
+    """
+    if pool is None:
+        return model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True,
+                            convert_to_numpy=True)
+    vectors = model.encode_multi_process(texts, pool, batch_size=EMBEDDING_BATCH_SIZE)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
 
-    # SentenceTransformer model
-    model = SentenceTransformer("paraphrase-MiniLM-L6-v2")
 
-    # Qdrant local client (ensure Qdrant is running locally on this port)
-    qdrant = QdrantClient(url="http://localhost:6333")
+def embedding_hash(text, payload=None):
+    """
+    It computes the content hash of a point, stored in its payload.
+
+    :param text: text built by `build_embedding_text`
+    :param payload: optional payload of the point (without the hash), so that the points whose payload
+    fields changed are written again
+    :return: SHA-256 of the embedding model name, the text, and the payload, so that changing the model
+    also invalidates the stored vectors
+    """
+    content = f"{EMBEDDING_MODEL_NAME}\n{text}"
+    if payload is not None:
+        content += "\n" + json.dumps(payload, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def create_vector_store(force=False):
+    """
+    It creates the vector store with MovieLens movies descriptions, or synchronizes the existing one
+    with the item metadata file. The vectors are stored in the backend selected by `VECTOR_BACKEND`.
+
+    Every point stores the content hash of its embedded text (see `embedding_hash`), so only the
+    movies whose text changed (or that are new) are embedded again, and the points of the movies that
+    disappeared from the catalog are deleted. An up-to-date collection costs a scan of the stored hashes.
+
+    The descriptions are encoded in batches, optionally by several worker processes
+    (`EMBEDDING_WORKERS`), and streamed to the backend in chunks of `UPSERT_BATCH_SIZE` points. The ID of
+    every point is the item ID, so ingesting a movie again overwrites its point.
+
+    :param force: whether all the movies have to be embedded again, also when their text did not change
+    """
+    # Load your movie dataset, from the same parsed copy used to build the database
+    movies = [dict(zip(ITEM_COLUMNS, row)) for row in read_ml100k_items()]
+    movies = [mv for mv in movies if mv["title"] is not None]
+    texts = {int(mv["item_id"]): build_embedding_text(mv) for mv in movies}
+    item_lists = read_ml100k_item_lists(("genres_list",))
+    # genres and release year are stored next to the item ID, so that searches can be filtered on them
+    payloads = {
+        int(mv["item_id"]): {
+            "item_id": int(mv["item_id"]),
+            "storyline": mv["storyline"],
+            "genres": item_lists.get(int(mv["item_id"]), {}).get("genres_list", []),
+            "release_year": mv["release_date"]
+        }
+        for mv in movies
+    }
+    hashes = {item_id: embedding_hash(text, payloads[item_id]) for item_id, text in texts.items()}
+
+    # shared with the search tool (for Qdrant, ensure the server is running when VECTOR_BACKEND is "qdrant")
+    backend = get_vector_backend()
 
     collection_name = COLLECTION_NAME
+    exists = backend.exists()
+
+    if exists:
+        backend.ensure_payload_indexes()
 
-    existing_collections = qdrant.get_collections().collections
-    existing_names = {col.name for col in existing_collections}
+    stored = backend.stored_hashes() if exists else {}
+    # points of vanished movies, including the ones ingested with random UUIDs by older versions
+    removed = [point_id for point_id in stored if point_id not in hashes]
+    changed = [mv for mv in movies if force or stored.get(int(mv["item_id"])) != hashes[int(mv["item_id"])]]
 
-    if collection_name in existing_names:
-        print(f"⚠️ Collection '{collection_name}' already exists. Skipping creation.")
+    if not removed and not changed:
+        print(f"⚠️ Collection '{collection_name}' is up to date. Skipping ingestion.")
         return
 
-    # Create Qdrant collection
-    qdrant.create_collection(
-        collection_name=collection_name,
-        vectors_config=VectorParams(
-            size=model.get_sentence_embedding_dimension(),
-            distance=Distance.COSINE,
-        )
-    )
-
-    # Helper to build movie description
-    def build_embedding_text(mv: pd.Series) -> str:
-        fields = [f"Title: {mv['title']}"]
-
-        if mv["genres"] != "unknown":
-            fields.append(f"Genres: {mv['genres']}")
-
-        if mv["storyline"] != "unknown":
-            fields.append(f"Storyline: {mv['storyline']}")
-
-        return ". \n".join(fields) + "."
-
-    # Prepare data for insertion
-    points = []
-    for _, mv in movies.iterrows():
-        if mv["title"] != "unknown":
-            text = build_embedding_text(mv)
-            vec = model.encode(
-                text,
-                normalize_embeddings=True,
-                convert_to_numpy=True,
-            ).tolist()
-
-            metadata = {
-                "item_id": int(mv["item_id"]),
-                "storyline": None if mv["storyline"] == "unknown" else mv["storyline"]
-            }
+    if removed:
+        backend.delete(removed)
+        backend.flush()
+        print(f"{get_time()} - Deleted {len(removed)} vanished movies from collection '{collection_name}'.")
 
-            points.append(
-                PointStruct(
-                    id=str(uuid.uuid4()),  # unique identifier
-                    vector=vec,
-                    payload=metadata
-                )
-            )
+    if not changed:
+        return
 
-    # Upload data to Qdrant
-    qdrant.upsert(
-        collection_name=collection_name,
-        points=points
-    )
+    # SentenceTransformer model
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
 
-    print(f"✅ Ingested {len(points)} movie descriptions into Qdrant collection '{collection_name}'.")
+    if not exists:
+        backend.create(model.get_sentence_embedding_dimension())
+        backend.ensure_payload_indexes()
+
+    pool = model.start_multi_process_pool(["cpu"] * EMBEDDING_WORKERS) if EMBEDDING_WORKERS > 1 else None
+    start = time.perf_counter()
+    ingested = 0
+    try:
+        # every chunk is encoded and upserted before the next one, so memory does not grow with the catalog
+        for first in range(0, len(changed), UPSERT_BATCH_SIZE):
+            chunk = changed[first:first + UPSERT_BATCH_SIZE]
+            vectors = encode_texts(model, [texts[int(mv["item_id"])] for mv in chunk], pool)
+            backend.upsert(
+                # deterministic identifiers
+                [int(mv["item_id"]) for mv in chunk],
+                vectors,
+                [dict(payloads[int(mv["item_id"])], content_hash=hashes[int(mv["item_id"])]) for mv in chunk]
+            )
+            ingested += len(chunk)
+            elapsed = time.perf_counter() - start
+            print(f"{get_time()} - Ingested {ingested}/{len(changed)} movie descriptions "
+                  f"({ingested / max(elapsed, 1e-9):.1f} items/s).")
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+        backend.flush()
+
+    print(f"✅ Ingested {ingested} new or changed movie descriptions into collection '{collection_name}' "
+          f"({VECTOR_BACKEND} backend) in {time.perf_counter() - start:.2f}s.")
 
 
 def ensure_qdrant_running():
+    """
+    It starts the Qdrant server in a Docker container, if it is not running yet. The local and NumPy
+    vector backends run in-process, so nothing is started for them.
+    """
+    if VECTOR_BACKEND != "qdrant":
+        print(f"✅ Vector backend '{VECTOR_BACKEND}' runs in-process, no Qdrant server is needed.")
+        return
+
     client = docker.from_env()
     image_name = "qdrant/qdrant"
     container_name = "qdrant_local"
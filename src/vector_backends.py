@@ -0,0 +1,514 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams, PointStruct, PointIdsList, Filter, FieldCondition, \
+    MatchAny, SearchParams, QueryRequest, PayloadSchemaType
+from src.constants import COLLECTION_NAME, QDRANT_URL, VECTOR_BACKEND, QDRANT_PATH, VECTOR_INDEX_DIR
+
+# payload fields indexed by Qdrant, so that filters on them do not scan all the points
+PAYLOAD_INDEXES = {
+    "item_id": PayloadSchemaType.INTEGER,
+    "genres": PayloadSchemaType.KEYWORD,
+    "release_year": PayloadSchemaType.INTEGER,
+}
+# searches restricted to at most this number of items score the stored vectors of the candidates exactly,
+# instead of filtering the index of the whole collection
+EXACT_SEARCH_MAX_CANDIDATES = int(os.getenv("EXACT_SEARCH_MAX_CANDIDATES", 256))
+
+
+def top_hits(ids: np.ndarray, payloads: List[dict], rows: np.ndarray, scores: np.ndarray, limit: int,
+             score_threshold: Optional[float] = None) -> List[dict]:
+    """
+    :param ids: sorted point IDs
+    :param payloads: payloads of the points
+    :param rows: rows of the scored points
+    :param scores: similarities of the scored points with the query
+    :param limit: maximum number of hits to be returned
+    :param score_threshold: optional minimum similarity of the hits
+    :return: hits sorted by decreasing similarity, as dictionaries with the "id", "score", and "payload" keys
+    """
+    n = min(limit, len(rows))
+    if n == 0:
+        return []
+    top = np.argpartition(-scores, n - 1)[:n]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    if score_threshold is not None:
+        top = top[scores[top] >= score_threshold]
+    return [{"id": int(ids[rows[i]]), "score": float(scores[i]), "payload": payloads[rows[i]]}
+            for i in top.tolist()]
+
+
+def candidate_rows(ids: np.ndarray, items: Optional[List[int]]) -> np.ndarray:
+    """
+    :param ids: sorted point IDs
+    :param items: item IDs a search is restricted to, or None
+    :return: rows of the points of the given items (all the rows if no item is given)
+    """
+    if items is None:
+        return np.arange(len(ids))
+    items = np.unique(np.asarray(items, dtype=np.int64))
+    rows = np.searchsorted(ids, items)
+    return rows[(rows < len(ids)) & (ids[np.minimum(rows, len(ids) - 1)] == items)]
+
+
+class QdrantBackend:
+    """
+    Vector backend storing the points in a Qdrant collection, either on a Qdrant server (the Docker
+    container started by `ensure_qdrant_running`) or in Qdrant's local mode, where the collection is
+    kept in a directory and searched in-process, without any server.
+
+    The strategy of a search restricted to some items depends on their number: up to
+    `exact_max_candidates` items, their vectors are retrieved by ID (the point ID is the item ID)
+    and scored exactly; above, the search runs on the HNSW index with a filter on the indexed
+    item_id of the payload.
+    """
+
+    def __init__(self, client: QdrantClient, collection_name: str = COLLECTION_NAME, local: bool = False,
+                 exact_max_candidates: int = EXACT_SEARCH_MAX_CANDIDATES) -> None:
+        self.client = client
+        self.collection_name = collection_name
+        # the local mode searches exactly, without HNSW search parameters and payload indexes
+        self.local = local
+        self.exact_max_candidates = exact_max_candidates
+        self._version = None
+
+    def exists(self) -> bool:
+        return self.client.collection_exists(self.collection_name)
+
+    def create(self, dimensions: int) -> None:
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(size=dimensions, distance=Distance.COSINE)
+        )
+
+    def ensure_payload_indexes(self) -> None:
+        """
+        Creates the payload indexes of `PAYLOAD_INDEXES` that do not exist yet.
+        """
+        if self.local:
+            return
+        existing = self.client.get_collection(self.collection_name).payload_schema or {}
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name not in existing:
+                self.client.create_payload_index(collection_name=self.collection_name, field_name=field_name,
+                                                 field_schema=field_schema, wait=True)
+
+    def stored_hashes(self, page_size: int = 1024) -> Dict:
+        """
+        Reads the content hash of every point, without transferring the vectors.
+
+        :param page_size: number of points read per request
+        :return: dictionary point ID -> content hash (None for points ingested without a hash)
+        """
+        stored = {}
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=["content_hash"],
+                with_vectors=False
+            )
+            for point in points:
+                stored[point.id] = (point.payload or {}).get("content_hash")
+            if offset is None:
+                return stored
+
+    def version(self) -> str:
+        """
+        :return: digest of the content hashes of the points, which changes whenever a point is added,
+        changed, or deleted through this backend
+        """
+        if self._version is None:
+            self._version = hashes_digest(self.stored_hashes())
+        return self._version
+
+    def vector(self, point_id: int) -> Optional[np.ndarray]:
+        """
+        :param point_id: ID of the point (the item ID)
+        :return: stored vector of the point, or None if the point does not exist
+        """
+        points = self.client.retrieve(collection_name=self.collection_name, ids=[point_id], with_vectors=True)
+        return np.asarray(points[0].vector, dtype=np.float32) if points else None
+
+    def all_vectors(self, page_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param page_size: number of points read per request
+        :return: sorted point IDs and the matrix of their vectors. Points without an integer ID are left out
+        """
+        ids, vectors = [], []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=True
+            )
+            for point in points:
+                if isinstance(point.id, int):
+                    ids.append(point.id)
+                    vectors.append(point.vector)
+            if offset is None:
+                break
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        return ids[order], np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)[order]
+
+    def upsert(self, ids: List[int], vectors: np.ndarray, payloads: List[dict]) -> None:
+        self._version = None
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=[PointStruct(id=point_id, vector=vec.tolist(), payload=payload)
+                    for point_id, vec, payload in zip(ids, vectors, payloads)],
+            wait=True
+        )
+
+    def delete(self, ids: List) -> None:
+        self._version = None
+        self.client.delete(collection_name=self.collection_name, points_selector=PointIdsList(points=ids),
+                           wait=True)
+
+    def flush(self) -> None:
+        # every write is already persisted by Qdrant
+        pass
+
+    @staticmethod
+    def _item_filter(items: Optional[List[int]]) -> Optional[Filter]:
+        if items is None:
+            return None
+        return Filter(must=[FieldCondition(key="item_id", match=MatchAny(any=list(items)))])
+
+    def is_exact(self, items: Optional[List[int]]) -> bool:
+        """
+        :param items: item IDs a search is restricted to, or None
+        :return: whether the search scores the candidates exactly instead of using the index
+        """
+        return items is not None and len(items) <= self.exact_max_candidates
+
+    def exact_search_batch(self, query_vectors: List[List[float]], limit: int, items: List[List[int]],
+                           score_threshold: Optional[float] = None) -> List[List[dict]]:
+        """
+        Scores the stored vectors of the candidates of every query exactly. The candidates of all the
+        queries are retrieved with a single request.
+
+        :param query_vectors: normalized embeddings of the queries
+        :param limit: maximum number of hits to be returned for each query
+        :param items: for each query, the item IDs its search is restricted to
+        :param score_threshold: optional minimum similarity of the hits
+        :return: hits of every query, as returned by `search`
+        """
+        candidates = sorted({int(i) for query_items in items for i in query_items})
+        points = self.client.retrieve(collection_name=self.collection_name, ids=candidates, with_vectors=True,
+                                      with_payload=True) if candidates else []
+        ids = np.asarray([point.id for point in points], dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        payloads = [points[i].payload for i in order.tolist()]
+        vectors = np.asarray([points[i].vector for i in order.tolist()], dtype=np.float32).reshape(len(ids), -1)
+        results = []
+        for query_vector, query_items in zip(query_vectors, items):
+            if len(ids) == 0:
+                results.append([])
+                continue
+            rows = candidate_rows(ids, query_items)
+            scores = vectors[rows] @ np.asarray(query_vector, dtype=np.float32)
+            results.append(top_hits(ids, payloads, rows, scores, limit, score_threshold))
+        return results
+
+    def search(self, query_vector: List[float], limit: int, items: Optional[List[int]] = None,
+               hnsw_ef: int = 128, score_threshold: Optional[float] = None) -> List[dict]:
+        """
+        :param query_vector: normalized embedding of the query
+        :param limit: maximum number of hits to be returned
+        :param items: optional item IDs the search is restricted to
+        :param hnsw_ef: size of the HNSW candidate list used at search time
+        :param score_threshold: optional minimum similarity of the hits
+        :return: hits sorted by decreasing similarity, as dictionaries with the "id", "score", and "payload" keys
+        """
+        if self.is_exact(items):
+            return self.exact_search_batch([query_vector], limit, [items], score_threshold)[0]
+        return self.client.query_points(
+            collection_name=self.collection_name,
+            query=query_vector,
+            limit=limit,
+            query_filter=self._item_filter(items),
+            search_params=None if self.local else SearchParams(hnsw_ef=hnsw_ef),
+            score_threshold=score_threshold,
+            with_payload=True
+        ).model_dump()["points"]
+
+    def search_batch(self, query_vectors: List[List[float]], limit: int,
+                     items: Optional[List[Optional[List[int]]]] = None, hnsw_ef: int = 128,
+                     score_threshold: Optional[float] = None) -> List[List[dict]]:
+        """
+        Performs several searches. The ones restricted to few items are scored exactly (see `is_exact`),
+        the others are sent to Qdrant in a single batch request.
+
+        :param query_vectors: normalized embeddings of the queries
+        :param limit: maximum number of hits to be returned for each query
+        :param items: optional list with, for each query, the item IDs its search is restricted to (None
+        for an unrestricted search)
+        :param hnsw_ef: size of the HNSW candidate list used at search time
+        :param score_threshold: optional minimum similarity of the hits
+        :return: hits of every query, as returned by `search`
+        """
+        items = items if items is not None else [None] * len(query_vectors)
+        results = [None] * len(query_vectors)
+        exact = [q for q, query_items in enumerate(items) if self.is_exact(query_items)]
+        indexed = [q for q, query_items in enumerate(items) if not self.is_exact(query_items)]
+        if exact:
+            hits = self.exact_search_batch([query_vectors[q] for q in exact], limit, [items[q] for q in exact],
+                                           score_threshold)
+            for q, query_hits in zip(exact, hits):
+                results[q] = query_hits
+        if indexed:
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[
+                    QueryRequest(query=query_vectors[q], limit=limit, filter=self._item_filter(items[q]),
+                                 params=None if self.local else SearchParams(hnsw_ef=hnsw_ef),
+                                 score_threshold=score_threshold, with_payload=True)
+                    for q in indexed
+                ]
+            )
+            for q, response in zip(indexed, responses):
+                results[q] = response.model_dump()["points"]
+        return results
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class NumpyVectorBackend:
+    """
+    Vector backend storing the points as NumPy arrays in a directory, searched exactly in-process.
+
+    The point IDs (the item IDs) are kept sorted together with the matrix of their normalized vectors,
+    which is memory-mapped when loaded, and the payloads are stored in a JSON file. A search is a
+    single matrix-vector product over the whole matrix or over the rows of the requested items, which
+    are located by binary search. Writes are applied in memory and saved to disk by `flush`.
+    """
+
+    def __init__(self, index_dir: str = VECTOR_INDEX_DIR) -> None:
+        self.index_dir = index_dir
+        self.ids: Optional[np.ndarray] = None
+        self.vectors: Optional[np.ndarray] = None
+        self.payloads: List[dict] = []
+        self._version = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        try:
+            ids = np.load(os.path.join(self.index_dir, "ids.npy"))
+            vectors = np.load(os.path.join(self.index_dir, "vectors.npy"), mmap_mode="r")
+            with open(os.path.join(self.index_dir, "payloads.json"), "r") as f:
+                payloads = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.ids, self.vectors, self.payloads = ids, vectors, payloads
+
+    def exists(self) -> bool:
+        return self.ids is not None
+
+    def create(self, dimensions: int) -> None:
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dimensions), dtype=np.float32)
+        self.payloads = []
+        self._version = None
+
+    def ensure_payload_indexes(self) -> None:
+        # the point IDs are sorted, so the items of a search are already found by binary search
+        pass
+
+    def stored_hashes(self) -> Dict:
+        if self.ids is None:
+            return {}
+        return {point_id: payload.get("content_hash") for point_id, payload in zip(self.ids.tolist(), self.payloads)}
+
+    def version(self) -> str:
+        """
+        :return: digest of the content hashes of the points, which changes whenever a point is added,
+        changed, or deleted
+        """
+        if self._version is None:
+            self._version = hashes_digest(self.stored_hashes())
+        return self._version
+
+    def vector(self, point_id: int) -> Optional[np.ndarray]:
+        """
+        :param point_id: ID of the point (the item ID)
+        :return: stored vector of the point, or None if the point does not exist
+        """
+        ids, vectors = self.ids, self.vectors
+        if ids is None or len(ids) == 0:
+            return None
+        row = np.searchsorted(ids, point_id)
+        return np.asarray(vectors[row], dtype=np.float32) if row < len(ids) and ids[row] == point_id else None
+
+    def all_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: sorted point IDs and the matrix of their vectors
+        """
+        if self.ids is None:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+        return self.ids, np.asarray(self.vectors, dtype=np.float32)
+
+    def _replace(self, keep: np.ndarray, ids: np.ndarray, vectors: np.ndarray, payloads: List[dict]) -> None:
+        # the lock must be held by the caller. The kept rows and the new ones are merged and sorted by ID
+        all_ids = np.concatenate([self.ids[keep], ids])
+        order = np.argsort(all_ids, kind="stable")
+        all_vectors = np.concatenate([np.asarray(self.vectors[keep], dtype=np.float32), vectors])
+        all_payloads = [self.payloads[i] for i in np.flatnonzero(keep).tolist()] + payloads
+        # the arrays are swapped together, so concurrent searches see either the old or the new index
+        self.ids, self.vectors, self.payloads = all_ids[order], all_vectors[order], \
+            [all_payloads[i] for i in order.tolist()]
+        self._version = None
+
+    def upsert(self, ids: List[int], vectors: np.ndarray, payloads: List[dict]) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            keep = ~np.isin(self.ids, ids)
+            self._replace(keep, ids, np.asarray(vectors, dtype=np.float32), list(payloads))
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            keep = ~np.isin(self.ids, np.asarray([i for i in ids if isinstance(i, int)], dtype=np.int64))
+            self._replace(keep, np.empty(0, dtype=np.int64), np.empty((0, self.vectors.shape[1]), dtype=np.float32),
+                          [])
+
+    def flush(self) -> None:
+        """
+        Saves the index to disk. Every file is written to a temporary file first, so a crash never
+        leaves a partial file.
+        """
+        with self._lock:
+            os.makedirs(self.index_dir, exist_ok=True)
+            files = {"ids.npy": self.ids, "vectors.npy": np.asarray(self.vectors, dtype=np.float32)}
+            for name, array in files.items():
+                tmp_path = os.path.join(self.index_dir, f"{name}.tmp")
+                with open(tmp_path, "wb") as f:
+                    np.save(f, array)
+                os.replace(tmp_path, os.path.join(self.index_dir, name))
+            tmp_path = os.path.join(self.index_dir, "payloads.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self.payloads, f)
+            os.replace(tmp_path, os.path.join(self.index_dir, "payloads.json"))
+
+    def search(self, query_vector: List[float], limit: int, items: Optional[List[int]] = None,
+               hnsw_ef: int = 128, score_threshold: Optional[float] = None) -> List[dict]:
+        """
+        :param query_vector: normalized embedding of the query
+        :param limit: maximum number of hits to be returned
+        :param items: optional item IDs the search is restricted to
+        :param hnsw_ef: ignored, the search is exact
+        :param score_threshold: optional minimum similarity of the hits
+        :return: hits sorted by decreasing similarity, as dictionaries with the "id", "score", and "payload" keys
+        """
+        ids, vectors, payloads = self.ids, self.vectors, self.payloads
+        if ids is None or len(ids) == 0:
+            return []
+        rows = candidate_rows(ids, items)
+        scores = vectors[rows] @ np.asarray(query_vector, dtype=np.float32)
+        return top_hits(ids, payloads, rows, scores, limit, score_threshold)
+
+    def search_batch(self, query_vectors: List[List[float]], limit: int,
+                     items: Optional[List[Optional[List[int]]]] = None, hnsw_ef: int = 128,
+                     score_threshold: Optional[float] = None) -> List[List[dict]]:
+        """
+        Performs several searches. The unrestricted ones are scored together with a single
+        matrix-matrix product.
+
+        :param query_vectors: normalized embeddings of the queries
+        :param limit: maximum number of hits to be returned for each query
+        :param items: optional list with, for each query, the item IDs its search is restricted to (None
+        for an unrestricted search)
+        :param hnsw_ef: ignored, the search is exact
+        :param score_threshold: optional minimum similarity of the hits
+        :return: hits of every query, as returned by `search`
+        """
+        ids, vectors, payloads = self.ids, self.vectors, self.payloads
+        if ids is None or len(ids) == 0:
+            return [[] for _ in query_vectors]
+        items = items if items is not None else [None] * len(query_vectors)
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1)
+        results = [None] * len(queries)
+        unrestricted = [q for q, query_items in enumerate(items) if query_items is None]
+        if unrestricted:
+            rows = np.arange(len(ids))
+            scores = queries[unrestricted] @ np.asarray(vectors).T
+            for q, query_scores in zip(unrestricted, scores):
+                results[q] = top_hits(ids, payloads, rows, query_scores, limit, score_threshold)
+        for q, query_items in enumerate(items):
+            if query_items is not None:
+                rows = candidate_rows(ids, query_items)
+                results[q] = top_hits(ids, payloads, rows, vectors[rows] @ queries[q], limit, score_threshold)
+        return results
+
+    def close(self) -> None:
+        pass
+
+
+def hashes_digest(stored: Dict) -> str:
+    """
+    :param stored: dictionary point ID -> content hash, as returned by `stored_hashes`
+    :return: digest identifying the content of a collection
+    """
+    sha = hashlib.sha256()
+    for point_id, content_hash in sorted(stored.items(), key=lambda entry: str(entry[0])):
+        sha.update(f"{point_id}:{content_hash}\n".encode("utf-8"))
+    return sha.hexdigest()
+
+
+def open_vector_backend(backend: str = VECTOR_BACKEND):
+    """
+    Creates the vector backend of the given type.
+
+    :param backend: "qdrant" for the Qdrant server at QDRANT_URL, "qdrant_local" for Qdrant's local
+    mode on the directory QDRANT_PATH, or "numpy" for the exact NumPy index in VECTOR_INDEX_DIR
+    :return: the backend
+    """
+    if backend == "qdrant":
+        return QdrantBackend(QdrantClient(url=QDRANT_URL))
+    if backend == "qdrant_local":
+        return QdrantBackend(QdrantClient(path=QDRANT_PATH), local=True)
+    if backend == "numpy":
+        return NumpyVectorBackend(VECTOR_INDEX_DIR)
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_vector_backend():
+    """
+    Returns the process-wide vector backend, selected by VECTOR_BACKEND. It is shared by the ingestion
+    and the search, as a local Qdrant directory can be opened by a single client at a time.
+
+    :return: the shared vector backend
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = open_vector_backend()
+    return _backend
+
+
+def close_vector_backend() -> None:
+    """
+    Closes the process-wide vector backend. It is transparently opened again on the next request.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
@@ -0,0 +1,220 @@
+import os
+import threading
+from typing import List, Optional
+from sentence_transformers import SentenceTransformer
+from src.constants import EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE
+from src.item_catalog import get_item_catalog
+from src.query_cache import LRUCache
+from src.utils import get_time
+from src.vector_backends import get_vector_backend, close_vector_backend
+
+# number of query embeddings kept in memory
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 4096))
+# number of search results kept in memory
+QUERY_RESULT_CACHE_SIZE = int(os.getenv("QUERY_RESULT_CACHE_SIZE", 1024))
+
+
+class VectorStoreService:
+    """
+    Embedding-and-search service shared by all the tool calls and chat sessions of the process.
+
+    The SentenceTransformer model and the vector backend (see `src.vector_backends`) are expensive to
+    create, so they are loaded only once (lazily on the first use or explicitly through `start`) and
+    kept warm until `close` is called.
+
+    Agents often repeat the same query (e.g., the storyline of a movie, to find similar ones), so the
+    query embeddings and the search results are kept in LRU caches. Embeddings are keyed by the model
+    name and the query, and results also by the version of the collection, so they are never served
+    after the collection has changed. When the query is the storyline of a movie, the vector stored
+    for that movie is used instead of encoding the query.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, embedding_cache_size: int = QUERY_EMBEDDING_CACHE_SIZE,
+                 result_cache_size: int = QUERY_RESULT_CACHE_SIZE) -> None:
+        self.model_name = model_name
+        self._embedder = None
+        self._backend = None
+        self._lock = threading.Lock()
+        self.embedding_cache = LRUCache(embedding_cache_size)
+        self.result_cache = LRUCache(result_cache_size)
+        # (catalog, storyline -> item ID) of the catalog the mapping has been built from
+        self._storylines = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._embedder is not None and self._backend is not None
+
+    def start(self) -> "VectorStoreService":
+        """
+        Loads the embedding model and connects to the vector store. Calling it on a running service
+        has no effect.
+
+        :return: the service itself
+        """
+        with self._lock:
+            if self._embedder is None:
+                print(f"\n{get_time()} - Loading embedding model {self.model_name}.\n")
+                self._embedder = SentenceTransformer(self.model_name)
+                # run a dummy encoding so that the first user query does not pay the warm-up cost
+                self._embedder.encode("warm-up", convert_to_numpy=True, normalize_embeddings=True)
+            if self._backend is None:
+                self._backend = get_vector_backend()
+        return self
+
+    def close(self) -> None:
+        """
+        Releases the embedding model and the connection to the vector store.
+        """
+        with self._lock:
+            if self._backend is not None:
+                close_vector_backend()
+            self._backend = None
+            self._embedder = None
+
+    @property
+    def embedder(self) -> SentenceTransformer:
+        if self._embedder is None:
+            self.start()
+        return self._embedder
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self.start()
+        return self._backend
+
+    def storyline_item(self, query: str) -> Optional[int]:
+        """
+        :param query: text of the query
+        :return: ID of the movie whose storyline is the query, or None
+        """
+        catalog = get_item_catalog()
+        if self._storylines is None or self._storylines[0] is not catalog:
+            storylines = {}
+            for item_id, storyline in zip(catalog.item_ids.tolist(), catalog.columns["storyline"].tolist()):
+                if storyline is not None:
+                    storylines.setdefault(storyline.strip(), item_id)
+            self._storylines = (catalog, storylines)
+        return self._storylines[1].get(query.strip())
+
+    def query_vectors(self, queries: List[str]) -> List[List[float]]:
+        """
+        Returns the embeddings used to search the given queries: the stored vector of the movie if the
+        query is its storyline, the cached embedding of the query, or a new one. All the new embeddings
+        are computed with a single call to the model.
+
+        :param queries: texts of the queries
+        :return: normalized embeddings, in the same order as the queries
+        """
+        vectors = [None] * len(queries)
+        # query -> positions of the queries to be encoded
+        missing = {}
+        for q, query in enumerate(queries):
+            item_id = self.storyline_item(query)
+            if item_id is not None:
+                vector = self.backend.vector(item_id)
+                if vector is not None:
+                    vectors[q] = vector.tolist()
+                    continue
+            vector = self.embedding_cache.get((self.model_name, query))
+            if vector is None:
+                missing.setdefault(query, []).append(q)
+            else:
+                vectors[q] = vector
+        if missing:
+            encoded = self.embedder.encode(list(missing), batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True,
+                                           normalize_embeddings=True)
+            for (query, positions), vector in zip(missing.items(), encoded):
+                vector = vector.tolist()
+                self.embedding_cache.put((self.model_name, query), vector)
+                for q in positions:
+                    vectors[q] = vector
+        return vectors
+
+    def search_queries(self, queries: List[str], limit: int, items: Optional[List[Optional[List[int]]]] = None,
+                       score_threshold: Optional[float] = None) -> List[dict]:
+        """
+        Performs the similarity searches of the given queries. The searches already performed on the
+        current version of the collection are answered from the result cache, the others are encoded
+        with a single call to the model and sent to the vector backend as a single batch. The returned
+        dictionaries are shared with the cache, so they must not be modified.
+
+        :param queries: texts of the queries
+        :param limit: maximum number of hits to be returned for each query
+        :param items: optional list with, for each query, the item IDs its search is restricted to (None
+        for an unrestricted search)
+        :param score_threshold: optional minimum similarity of the hits
+        :return: for each query, a dictionary with the hits of the search under the "points" key
+        """
+        items = items if items is not None else [None] * len(queries)
+        version = self.backend.version()
+        keys = [(self.model_name, version, query, limit, score_threshold,
+                 None if query_items is None else tuple(sorted(set(int(i) for i in query_items))))
+                for query, query_items in zip(queries, items)]
+        results = [self.result_cache.get(key) for key in keys]
+        missing = [q for q, result in enumerate(results) if result is None]
+        if missing:
+            hits = self.backend.search_batch(self.query_vectors([queries[q] for q in missing]), limit,
+                                             items=[items[q] for q in missing], score_threshold=score_threshold)
+            for q, query_hits in zip(missing, hits):
+                results[q] = {"points": query_hits}
+                self.result_cache.put(keys[q], results[q])
+        return results
+
+    def search_query(self, query: str, limit: int, items: Optional[List[int]] = None,
+                     score_threshold: Optional[float] = None) -> dict:
+        """
+        Performs a similarity search of the given query (see `search_queries`).
+
+        :param query: text of the query
+        :param limit: maximum number of hits to be returned
+        :param items: optional item IDs the search is restricted to
+        :param score_threshold: optional minimum similarity of the hits
+        :return: dictionary with the hits of the search under the "points" key
+        """
+        return self.search_queries([query], limit, [items], score_threshold)[0]
+
+    def cache_stats(self) -> dict:
+        """
+        :return: hit and miss counters of the embedding and the result caches
+        """
+        return {"embeddings": self.embedding_cache.stats(), "results": self.result_cache.stats()}
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_vector_store_service() -> VectorStoreService:
+    """
+    Returns the process-wide vector store service, creating it if needed. The model and the client
+    are loaded lazily, so call `start_vector_store_service` at startup to warm them up.
+
+    :return: the shared vector store service
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = VectorStoreService()
+    return _service
+
+
+def start_vector_store_service() -> VectorStoreService:
+    """
+    Creates and warms up the process-wide vector store service. Meant to be called at application startup.
+
+    :return: the shared vector store service
+    """
+    return get_vector_store_service().start()
+
+
+def stop_vector_store_service() -> None:
+    """
+    Releases the resources held by the process-wide vector store service.
+    """
+    global _service
+    with _service_lock:
+        if _service is not None:
+            _service.close()
+            _service = None